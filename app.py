@@ -1,10 +1,18 @@
 from flask import Flask, render_template, redirect, flash, session, request
+from flask import jsonify, Response
 from flask_debugtoolbar import DebugToolbarExtension
-from flask_mail import Mail, Message
+from flask_mail import Mail
+from flask_migrate import Migrate
 from models import db, connect_db, User, Species, City, Country
-from models import SpeciesError, CountryError
+from models import CitySpeciesCount, REFRESH_WORKERS, refresh_species
+from models import SpeciesError, SpeciesUnavailable, CountryError
 from forms import SignupForm, LoginForm, EditForm
+from concurrent.futures import ThreadPoolExecutor
 from helpers import *
+from iucn import BREAKER_RESET
+import instrumentation
+import metrics
+import click
 import os
 
 app = Flask(__name__)
@@ -18,13 +26,13 @@ app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 PASSWORD = os.environ.get("PASSWORD")
 
 mail_settings = {
-    "MAIL_SERVER": "smtp.gmail.com",
+    "MAIL_SERVER": os.environ.get("MAIL_SERVER", "smtp.gmail.com"),
     "TESTING": False,
     "MAIL_DEBUG": True,
     "MAIL_SUPPRESS_SEND": False,
-    "MAIL_PORT": 465,
+    "MAIL_PORT": int(os.environ.get("MAIL_PORT", 465)),
     "MAIL_USE_TLS": False,
-    "MAIL_USE_SSL": True,
+    "MAIL_USE_SSL": os.environ.get("MAIL_USE_SSL", "true") == "true",
     "MAIL_USERNAME": "seanthomasgibson@gmail.com",
     "MAIL_PASSWORD": PASSWORD
 }
@@ -32,9 +40,80 @@ app.config.update(mail_settings)
 
 debug = DebugToolbarExtension(app)
 connect_db(app)
+instrumentation.init_app(app)
+metrics.init_app(app)
 
 mail = Mail(app)
 
+migrate = Migrate(app, db)
+
+@app.before_first_request
+def load_country_registry() -> None:
+    """
+        Loads countries into memory when worker starts handling requests, so
+        that forms don't need to query for them
+    """
+
+    Country.registry()
+
+@app.cli.command("load-countries")
+@click.option(
+    "--source",
+    type=click.Choice(["snapshot", "api"]),
+    default="snapshot",
+    help="Load countries from snapshot shipped with app or from Red List API"
+)
+def load_countries_command(source: str) -> None:
+    """
+        Loads all countries into db
+        :type source: str
+    """
+
+    try:
+        if source == "api":
+            Country.get_countries()
+        else:
+            Country.load_snapshot()
+    except CountryError as exc:
+        raise click.ClickException(exc.message)
+    click.echo(f"Loaded {len(Country.registry().choices)} countries")
+
+@app.cli.command("rebuild-counts")
+def rebuild_counts_command() -> None:
+    """
+        Recounts number of users in each city with each species in their list
+    """
+
+    CitySpeciesCount.rebuild()
+    click.echo("Rebuilt counts of users in each city with each species")
+
+@app.cli.command("refresh-species")
+@click.option(
+    "--limit",
+    default=500,
+    help="Most species to refresh, oldest first"
+)
+@click.option(
+    "--workers",
+    default=REFRESH_WORKERS,
+    help="Species to refresh at the same time"
+)
+def refresh_species_command(limit: int, workers: int) -> None:
+    """
+        Fetches data of species that haven't been fetched from the API in a
+        while again
+        :type limit: int
+        :type workers: int
+    """
+
+    names = Species.get_stale_names(limit)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        refreshed = list(executor.map(
+            lambda name: refresh_species(app, name),
+            names
+        ))
+    click.echo(f"Refreshed {sum(refreshed)} of {len(names)} stale species")
+
 def login(user_id: int) -> None:
     """
         Stores user_id in session
@@ -76,19 +155,17 @@ def signup_form() -> str:
     form = SignupForm()
 
     # get countries for user to select
-    countries = Country.query.all()
-    # if first time a user goes on this page, need to pull from API
-    if len(countries) == 0:
+    countries = Country.registry()
+    # if countries were never loaded (see load-countries command), load
+    # them from snapshot shipped with app
+    if not countries.choices:
         try:
-            Country.get_countries()
-            countries = Country.query.all()
+            Country.load_snapshot()
+            countries = Country.registry()
         except CountryError as exc:
             flash(exc.message, "danger")
             return redirect("/")
-    country_choices = []
-    for country in countries:
-        country_choices.append((country.code, country.name))
-    form.country.choices = country_choices
+    form.country.choices = list(countries.choices)
 
     if form.validate_on_submit():
         username = form.username.data
@@ -169,7 +246,8 @@ def show_home_page() -> str:
 create an account."
     user_id = session.get("current_user_id", None)
     if user_id:
-        user = User.query.get(user_id)
+        # load everything page shows up front, instead of while rendering it
+        user = User.get_with_species(user_id)
 
         species_id = session.get("species_id", None)
         if species_id:
@@ -194,7 +272,7 @@ def get_species_data() -> str:
 create an account."
     user_id = session.get("current_user_id", None)
     if user_id:
-        user = User.query.get(user_id)
+        user = User.get_with_city(user_id)
         species_name = request.args["species"]
         # if user clicks search on blank input, remove species from page
         if not species_name:
@@ -202,7 +280,7 @@ create an account."
                 del session["species_id"]
             return redirect("/home")
         try:
-            species = Species.get_species(species_name, user.city.country.id)
+            species = Species.get_species(species_name, user.city.country_id)
             session["species_id"] = species.id
         except SpeciesError as exc:
             if session.get("species_id", None):
@@ -213,6 +291,51 @@ create an account."
     flash(error_message, "danger")
     return redirect("/login")
 
+@app.route("/api/species")
+def get_species_json() -> Response:
+    """
+        Gets data on species with name given by name query parameter as JSON,
+        including whether it's in the user's country. Answers with 304 if
+        client already has the same data, going by its ETag.
+        :rtype: Response
+    """
+
+    user_id = session.get("current_user_id", None)
+    if not user_id:
+        error_message = "Please first login or create an account."
+        return jsonify(error=error_message), 401
+    species_name = request.args.get("name", "").strip()
+    if not species_name:
+        return jsonify(error="Please give a species name."), 400
+    try:
+        species = Species.lookup(species_name)
+    except SpeciesUnavailable as exc:
+        # API is down, so ask client to come back once it may be up again,
+        # and don't let anyone keep the error
+        resp = jsonify(error=exc.message)
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(int(BREAKER_RESET))
+        resp.cache_control.no_store = True
+        return resp
+    except SpeciesError as exc:
+        return jsonify(error=exc.message), 404
+
+    country_id = db.session.query(City.country_id).join(User).filter(
+        User.id == user_id
+    ).scalar()
+    resp = jsonify(
+        name=species.name,
+        category=species.threatened,
+        countries=sorted(country.code for country in species.countries),
+        in_my_country=species.in_country(country_id)
+    )
+    # answer depends on user's country, so only their browser may keep it
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    resp.vary.add("Cookie")
+    resp.add_etag()
+    return resp.make_conditional(request)
+
 @app.route("/species/<int:species_id>", methods=["POST"])
 def add_species_to_list(species_id: int) -> str:
     """
@@ -236,21 +359,11 @@ an account."
 
             # check if should notify user of other users who like the species
             curr_user = User.query.get(user_id)
-            species = Species.query.get(species_id)
             is_a_match = is_match(species_id, curr_user.city_id)
             if is_a_match:
-                # send email to each user in the same city who like the species
-                for user in [user for user in species.users if \
-                    user.city_id == curr_user.city_id]:
-                    notification = make_notification(species_id, user.id)
-                    with app.app_context():
-                        msg = Message(
-                            subject="Threatened Species Website",
-                            sender=app.config.get("MAIL_USERNAME"),
-                            recipients=[user.email],
-                            body=notification
-                        )
-                        mail.send(msg)
+                # email each user in the same city who like the species, which
+                # worker.py sends so that user doesn't wait for them
+                queue_notifications(species_id, curr_user.city_id)
             return redirect("/home")
 
         except SpeciesError as exc:
@@ -295,23 +408,21 @@ def edit_profile_form() -> str:
 create an account."
     user_id = session.get("current_user_id", None)
     if user_id:
-        user = User.query.get(user_id)
+        user = User.get_with_city(user_id)
         form = EditForm(username=user.username, email=user.email, city=user.city.name, country=user.city.country.code)
 
         # get countries for user to select
-        countries = Country.query.all()
-        # if first time a user goes on this page, need to pull from API
-        if len(countries) == 0:
+        countries = Country.registry()
+        # if countries were never loaded (see load-countries command), load
+        # them from snapshot shipped with app
+        if not countries.choices:
             try:
-                Country.get_countries()
-                countries = Country.query.all()
+                Country.load_snapshot()
+                countries = Country.registry()
             except CountryError as exc:
                 flash(exc.message, "danger")
                 return redirect("/")
-        country_choices = []
-        for country in countries:
-            country_choices.append((country.code, country.name))
-        form.country.choices = country_choices
+        form.country.choices = list(countries.choices)
 
         if form.validate_on_submit():
             username = form.username.data
@@ -322,8 +433,14 @@ create an account."
 
             # if user typed in right password, make changes
             if User.authenticate(user.username, password):
-                edit_profile(user_id, username, email, city, country)
-                return redirect("/")
+                if edit_profile(user_id, username, email, city, country):
+                    return redirect("/")
+                flash(
+                    "That username or email has already been taken. Could not \
+edit profile.",
+                    "danger"
+                )
+                return redirect("/edit")
             # otherwise, flash error message
             flash("Incorrect password. Could not edit profile.", "danger")
             return redirect("/edit")
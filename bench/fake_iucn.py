@@ -0,0 +1,120 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.parse import unquote, urlparse
+import json
+import os
+import time
+
+SNAPSHOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "data",
+    "countries.json"
+)
+CATEGORIES = ["LC", "NT", "VU", "EN", "CR"]
+# species with this in their name are unknown to the fake API
+UNKNOWN_MARKER = "unknown"
+
+class FakeIUCNHandler(BaseHTTPRequestHandler):
+    """
+        Answers the Red List API endpoints the app calls, with made up data
+        for any species name
+    """
+
+    # set by FakeIUCN
+    latency = 0
+    countries = []
+    species_countries = ["US"]
+
+    def do_GET(self) -> None:
+        """
+            Answers species, species countries, and country list requests
+        """
+
+        time.sleep(self.latency)
+        path = unquote(urlparse(self.path).path).strip("/")
+        parts = path.split("/")
+        if path.endswith("country/list"):
+            data = {
+                "count": len(self.countries),
+                "results": self.countries
+            }
+        elif len(parts) >= 4 and parts[-4:-1] == ["species", "countries", \
+            "name"]:
+            name = parts[-1]
+            result = [] if UNKNOWN_MARKER in name else [
+                { "code": code, "country": code } for code in \
+                    self.species_countries
+            ]
+            data = { "name": name, "result": result }
+        elif len(parts) >= 2 and parts[-2] == "species":
+            name = parts[-1]
+            category = CATEGORIES[sum(map(ord, name)) % len(CATEGORIES)]
+            result = [] if UNKNOWN_MARKER in name else [
+                { "scientific_name": name, "category": category }
+            ]
+            data = { "name": name, "result": result }
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        """
+            Keeps benchmark output quiet
+        """
+
+        pass
+
+class FakeIUCN:
+    """
+        Fake Red List API running on localhost in a background thread
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0) -> None:
+        """
+            Constructor for FakeIUCN. Port 0 picks any free port, and latency
+            is seconds added to every response.
+            :type port: int
+            :type latency: float
+        """
+
+        with open(SNAPSHOT, encoding="utf-8") as snapshot:
+            countries = json.load(snapshot)["results"]
+        handler = type(
+            "Handler",
+            (FakeIUCNHandler,),
+            { "latency": latency, "countries": countries }
+        )
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        """
+            Gets url to use as the app's IUCN_BASE_URL
+            :rtype: str
+        """
+
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/api/v3/"
+
+    def start(self) -> None:
+        """
+            Starts answering requests
+        """
+
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+            Stops answering requests
+        """
+
+        self.server.shutdown()
+        self.server.server_close()
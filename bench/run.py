@@ -0,0 +1,333 @@
+"""
+    Load test for the app, run against a fake Red List API and a local SMTP
+    sink. From the repo root:
+
+        python -m bench.run --users 50 --concurrency 10
+        python -m bench.run --baseline bench/baselines/main.json
+
+    Needs a Postgres database it is allowed to wipe (--database-url).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+from typing import Callable
+from bench.fake_iucn import FakeIUCN, UNKNOWN_MARKER
+from bench.smtp_sink import SMTPSink
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import re
+import requests
+import shutil
+import sys
+import tempfile
+import time
+
+ROUTES = ["signup", "logout", "login", "search", "home", "add", "delete"]
+
+def parse_args() -> argparse.Namespace:
+    """
+        Gets benchmark settings from command line
+        :rtype: argparse.Namespace
+    """
+
+    parser = argparse.ArgumentParser(description="Load test the app")
+    parser.add_argument(
+        "--database-url",
+        default=os.environ.get(
+            "BENCH_DATABASE_URL",
+            "postgresql:///threatened-species-bench"
+        ),
+        help="db to run against, which is wiped first"
+    )
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--searches",
+        type=int,
+        default=5,
+        help="species each user searches for and adds"
+    )
+    parser.add_argument(
+        "--species",
+        type=int,
+        default=20,
+        help="number of different species users search for"
+    )
+    parser.add_argument(
+        "--cities",
+        type=int,
+        default=3,
+        help="number of different cities users live in"
+    )
+    parser.add_argument(
+        "--miss-ratio",
+        type=float,
+        default=0.1,
+        help="share of searches for species the API doesn't know"
+    )
+    parser.add_argument(
+        "--delete-ratio",
+        type=float,
+        default=0.2,
+        help="share of added species that are removed again"
+    )
+    parser.add_argument(
+        "--iucn-latency",
+        type=float,
+        default=50,
+        help="milliseconds fake API waits before answering"
+    )
+    parser.add_argument("--match-num", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        default=os.path.join("bench", "results", "latest.json")
+    )
+    parser.add_argument(
+        "--baseline",
+        help="results file to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed slowdown of p95 compared to baseline, e.g. 0.2 = 20%%"
+    )
+    return parser.parse_args()
+
+def percentile(values: list, pct: float) -> float:
+    """
+        Gets pct percentile of values using nearest rank
+        :type values: list
+        :type pct: float
+        :rtype: float
+    """
+
+    if not values:
+        return 0
+    values = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(values)) - 1, 0)
+    return values[rank]
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """
+        Gets throughput and latency percentiles for each route from samples of
+        (route, milliseconds, ok)
+        :type samples: list
+        :type elapsed: float
+        :rtype: dict
+    """
+
+    routes = {}
+    for route in ROUTES:
+        times = [ms for (name, ms, ok) in samples if name == route]
+        if not times:
+            continue
+        routes[route] = {
+            "count": len(times),
+            "errors": len([ok for (name, ms, ok) in samples if \
+                name == route and not ok]),
+            "throughput_rps": round(len(times) / elapsed, 2),
+            "mean_ms": round(sum(times) / len(times), 2),
+            "p50_ms": round(percentile(times, 50), 2),
+            "p95_ms": round(percentile(times, 95), 2),
+            "p99_ms": round(percentile(times, 99), 2)
+        }
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "routes": routes
+    }
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+        Gets description of each route whose p95 got more than threshold
+        slower than in baseline
+        :type results: dict
+        :type baseline: dict
+        :type threshold: float
+        :rtype: list
+    """
+
+    regressions = []
+    for (route, stats) in results["routes"].items():
+        old_stats = baseline["routes"].get(route, None)
+        if not old_stats or not old_stats["p95_ms"]:
+            continue
+        change = stats["p95_ms"] / old_stats["p95_ms"] - 1
+        if change > threshold:
+            regressions.append(
+                f"{route}: p95 {old_stats['p95_ms']}ms -> \
+{stats['p95_ms']}ms (+{change:.0%})"
+            )
+    return regressions
+
+def main() -> int:
+    """
+        Runs benchmark, saves results, and compares them to baseline. Returns
+        1 if any route regressed, otherwise 0.
+        :rtype: int
+    """
+
+    args = parse_args()
+    rand = random.Random(args.seed)
+
+    fake_iucn = FakeIUCN(latency=args.iucn_latency / 1000)
+    fake_iucn.start()
+    smtp_sink = SMTPSink()
+    smtp_sink.start()
+
+    # each run starts with an empty IUCN response cache, so runs compare
+    cache_dir = tempfile.mkdtemp(prefix="bench-iucn-cache-")
+
+    # app reads these when it's imported
+    os.environ.update({
+        "DATABASE_URL": args.database_url,
+        "IUCN_BASE_URL": fake_iucn.base_url,
+        "MAIL_SERVER": "127.0.0.1",
+        "MAIL_PORT": str(smtp_sink.port),
+        "MAIL_USE_SSL": "false",
+        "MATCH_NUM": str(args.match_num),
+        # fake API has no quota, and the limit would be what's measured
+        "IUCN_RATE_LIMIT": "0",
+        "IUCN_CACHE_PATH": os.path.join(cache_dir, "iucn-cache.sqlite3")
+    })
+    from werkzeug.serving import make_server
+    from app import app
+    from models import db, Country
+    from worker import deliver_notifications
+
+    app.config["WTF_CSRF_ENABLED"] = False
+    logging.getLogger("instrumentation").setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        Country.load_snapshot()
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    # send notifications while load test runs, like worker.py would
+    done = Event()
+    def deliver() -> None:
+        with app.app_context():
+            while not done.is_set():
+                if deliver_notifications() == 0:
+                    done.wait(0.5)
+    worker = Thread(target=deliver, daemon=True)
+    worker.start()
+
+    species_names = [f"bench species {i}" for i in range(args.species)]
+    # each user gets their own searches, decided up front so runs repeat
+    plans = []
+    for i in range(args.users):
+        searches = []
+        for j in range(args.searches):
+            if rand.random() < args.miss_ratio:
+                searches.append(f"{UNKNOWN_MARKER} species {j}")
+            else:
+                searches.append(rand.choice(species_names))
+        deletes = [rand.random() < args.delete_ratio for j in searches]
+        plans.append((i, searches, deletes))
+
+    samples = []
+    samples_lock = Lock()
+
+    def timed(route: str, method: Callable, url: str, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            resp = method(f"{base_url}{url}", allow_redirects=False, **kwargs)
+            ok = resp.status_code < 400
+        except requests.RequestException:
+            resp = None
+            ok = False
+        ms = (time.perf_counter() - start_time) * 1000
+        with samples_lock:
+            samples.append((route, ms, ok))
+        return resp
+
+    def run_user(plan: tuple) -> None:
+        (i, searches, deletes) = plan
+        client = requests.Session()
+        credentials = {
+            "username": f"bench{i}",
+            "password": "password"
+        }
+        timed("signup", client.post, "/signup", data=dict(
+            credentials,
+            email=f"bench{i}@example.com",
+            city=f"Bench City {i % args.cities}",
+            country="US",
+            accept_terms="y"
+        ))
+        timed("logout", client.get, "/logout")
+        timed("login", client.post, "/login", data=credentials)
+        for (species_name, delete) in zip(searches, deletes):
+            timed("search", client.get, "/species", params={
+                "species": species_name
+            })
+            resp = timed("home", client.get, "/home")
+            match = re.search(r'action="/species/(\d+)"', resp.text) if \
+                resp is not None else None
+            if not match:
+                continue
+            species_id = match.group(1)
+            timed("add", client.post, f"/species/{species_id}")
+            if delete:
+                timed("delete", client.post, f"/species/{species_id}/delete")
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(run_user, plans))
+    elapsed = time.perf_counter() - start_time
+
+    done.set()
+    worker.join()
+    server.shutdown()
+    fake_iucn.stop()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    results = summarize(samples, elapsed)
+    results["emails_sent"] = smtp_sink.num_of_messages
+    smtp_sink.stop()
+    results["config"] = {
+        key: value for (key, value) in vars(args).items() if \
+            key not in ("database_url", "output", "baseline")
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+        output.write("\n")
+
+    print(f"{results['requests']} requests in {results['elapsed_s']}s \
+({results['throughput_rps']} req/s), {results['emails_sent']} emails sent")
+    print(f"{'route':<8}{'count':>7}{'errors':>8}{'req/s':>9}{'p50':>9}\
+{'p95':>9}{'p99':>9}")
+    for (route, stats) in results["routes"].items():
+        print(f"{route:<8}{stats['count']:>7}{stats['errors']:>8}\
+{stats['throughput_rps']:>9}{stats['p50_ms']:>9}{stats['p95_ms']:>9}\
+{stats['p99_ms']:>9}")
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Slower than baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No route slower than baseline {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Lock, Thread
+
+class SMTPSinkHandler(StreamRequestHandler):
+    """
+        Speaks just enough SMTP to accept messages, which are counted and then
+        thrown away
+    """
+
+    def reply(self, line: str) -> None:
+        """
+            Sends one reply line to client
+            :type line: str
+        """
+
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self) -> None:
+        """
+            Accepts messages until client quits
+        """
+
+        self.reply("220 localhost SMTP sink")
+        in_data = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.rstrip(b"\r\n")
+            if in_data:
+                if line == b".":
+                    in_data = False
+                    self.server.count_message()
+                    self.reply("250 OK")
+                continue
+            command = line[:4].upper()
+            if command == b"EHLO":
+                self.reply("250-localhost")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif command == b"DATA":
+                in_data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == b"AUTH":
+                self.reply("235 Authentication successful")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply("250 OK")
+
+class SMTPSink(ThreadingTCPServer):
+    """
+        SMTP server on localhost that accepts every message, running in a
+        background thread
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int = 0) -> None:
+        """
+            Constructor for SMTPSink. Port 0 picks any free port.
+            :type port: int
+        """
+
+        super().__init__(("127.0.0.1", port), SMTPSinkHandler)
+        self.num_of_messages = 0
+        self._lock = Lock()
+        self.thread = Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        """
+            Gets port sink is listening on
+            :rtype: int
+        """
+
+        return self.server_address[1]
+
+    def count_message(self) -> None:
+        """
+            Counts a message that was received
+        """
+
+        with self._lock:
+            self.num_of_messages += 1
+
+    def start(self) -> None:
+        """
+            Starts accepting messages
+        """
+
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+            Stops accepting messages
+        """
+
+        self.shutdown()
+        self.server_close()
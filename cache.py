@@ -0,0 +1,335 @@
+from collections import OrderedDict
+from threading import Event, Lock, local
+from typing import Any, Callable, Hashable, List
+import os
+import sqlite3
+import time
+
+class TTLCache:
+    """
+        In-process cache that forgets entries after ttl seconds, and drops the
+        least recently used entry once it holds maxsize entries
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        """
+            Constructor for TTLCache
+            :type maxsize: int
+            :type ttl: float
+        """
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+            Gets value stored for key, or default if there isn't one or it has
+            expired
+            :type key: Hashable
+            :type default: Any
+            :rtype: Any
+        """
+
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float = None) -> None:
+        """
+            Stores value for key for ttl seconds, or the cache's ttl if not
+            given
+            :type key: Hashable
+            :type value: Any
+            :type ttl: float
+        """
+
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """
+            Removes key from the cache if it's there
+            :type key: Hashable
+        """
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """
+            Removes every entry from the cache
+        """
+
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        """
+            Gets number of entries in the cache, including expired ones that
+            haven't been removed yet
+            :rtype: int
+        """
+
+        return len(self._entries)
+
+class SQLiteConnections:
+    """
+        Connections to a SQLite file, one for each thread, which stay open
+        between calls. Statements in setup, like creating tables, are run once
+        per process, and the cheap ones in pragmas on each new connection.
+        Connections are opened again after a fork, since SQLite connections
+        can't be shared with a child process. Transactions are started by
+        hand.
+    """
+
+    def __init__(self, path: str, setup: List[str], \
+        pragmas: List[str] = ()) -> None:
+        """
+            Constructor for SQLiteConnections
+            :type path: str
+            :type setup: list
+            :type pragmas: list
+        """
+
+        self.path = path
+        self.setup = setup
+        self.pragmas = pragmas
+        self._local = local()
+        self._setup_pid = None
+        self._lock = Lock()
+
+    def get(self) -> sqlite3.Connection:
+        """
+            Gets this thread's connection to the file, opening it if needed
+            :rtype: sqlite3.Connection
+        """
+
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) == pid:
+            return self._local.conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        with self._lock:
+            if self._setup_pid != pid:
+                for statement in self.setup:
+                    conn.execute(statement)
+                self._setup_pid = pid
+        self._local.conn = conn
+        self._local.pid = pid
+        return conn
+
+    @staticmethod
+    def rollback(conn: sqlite3.Connection) -> None:
+        """
+            Ends transaction left open on conn by an error, so the connection
+            can be used again
+            :type conn: sqlite3.Connection
+        """
+
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+
+class DiskCache:
+    """
+        Cache of strings kept in a SQLite file, so every process on the host
+        shares it. Entries are forgotten after ttl seconds, and those closest
+        to expiring are dropped once the values add up to more than max_bytes.
+    """
+
+    def __init__(self, path: str, ttl: float, max_bytes: int) -> None:
+        """
+            Constructor for DiskCache
+            :type path: str
+            :type ttl: float
+            :type max_bytes: int
+        """
+
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # readers don't wait on writers, and writes don't wait for the disk.
+        # WAL is kept in the file, but synchronous is set on each connection.
+        self.connections = SQLiteConnections(path, [
+            "PRAGMA journal_mode=WAL",
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, expires_at REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS ix_entries_expires_at "
+            "ON entries (expires_at)"
+        ], ["PRAGMA synchronous=NORMAL"])
+
+    def connect(self) -> sqlite3.Connection:
+        """
+            Gets this thread's connection to the cache's file, creating its
+            table the first time in each process
+            :rtype: sqlite3.Connection
+        """
+
+        return self.connections.get()
+
+    def get(self, key: str, default: str = None) -> str:
+        """
+            Gets value stored for key, or default if there isn't one or it has
+            expired
+            :type key: str
+            :type default: str
+            :rtype: str
+        """
+
+        row = self.connect().execute(
+            "SELECT value FROM entries WHERE key = ? AND expires_at > ?",
+            # wall clock, since it's the same in every process
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else default
+
+    def set(self, key: str, value: str, ttl: float = None) -> None:
+        """
+            Stores value for key for ttl seconds, or the cache's ttl if not
+            given, then drops entries until cache fits in max_bytes
+            :type key: str
+            :type value: str
+            :type ttl: float
+        """
+
+        if ttl is None:
+            ttl = self.ttl
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        conn = self.connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, size, now + ttl)
+            )
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            (total,) = conn.execute(
+                "SELECT total(size) FROM entries"
+            ).fetchone()
+            if total > self.max_bytes:
+                rows = conn.execute(
+                    "SELECT key, size FROM entries ORDER BY expires_at"
+                )
+                evicted = []
+                for (evicted_key, evicted_size) in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((evicted_key,))
+                    total -= evicted_size
+                conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+            conn.execute("COMMIT")
+        except BaseException:
+            self.connections.rollback(conn)
+            raise
+
+    def delete(self, key: str) -> None:
+        """
+            Removes key from the cache if it's there
+            :type key: str
+        """
+
+        self.connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        """
+            Removes every entry from the cache
+        """
+
+        self.connect().execute("DELETE FROM entries")
+
+    def __len__(self) -> int:
+        """
+            Gets number of entries in the cache, including expired ones that
+            haven't been removed yet
+            :rtype: int
+        """
+
+        return self.connect().execute(
+            "SELECT count(*) FROM entries"
+        ).fetchone()[0]
+
+class SingleFlight:
+    """
+        Makes callers asking for the same key at the same time share one call,
+        instead of each making their own
+    """
+
+    def __init__(self) -> None:
+        """
+            Constructor for SingleFlight
+        """
+
+        self._calls = {}
+        self._lock = Lock()
+
+    def do(self, key: Hashable, func: Callable, *args) -> Any:
+        """
+            Calls func with args and returns its result, unless a call for key
+            is already running, in which case waits for it and returns its
+            result instead. If the call raises, every caller waiting on it
+            gets the same exception.
+            :type key: Hashable
+            :type func: Callable
+            :rtype: Any
+        """
+
+        with self._lock:
+            call = self._calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = func(*args)
+            except BaseException as exc:
+                call.error = exc
+            finally:
+                # later callers start a new call instead of reusing this one
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def __len__(self) -> int:
+        """
+            Gets number of calls running
+            :rtype: int
+        """
+
+        return len(self._calls)
+
+class _Call:
+    """
+        Call made by SingleFlight, which callers for the same key wait on
+    """
+
+    def __init__(self) -> None:
+        """
+            Constructor for _Call
+        """
+
+        self.done = Event()
+        self.result = None
+        self.error = None
@@ -0,0 +1,32 @@
+import os
+import shutil
+import tempfile
+
+# must be set before prometheus_client is imported by master or workers
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR",
+    os.path.join(tempfile.gettempdir(), "threatened-species-metrics")
+)
+
+from prometheus_client import multiprocess
+
+# each worker handles requests on several threads, so one waiting on the Red
+# List API or on a password being hashed doesn't hold up the rest, and
+# threads looking up the same species share one call to the API
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+def on_starting(server) -> None:
+    """
+        Clears metrics left over from the last time server ran
+    """
+
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+def child_exit(server, worker) -> None:
+    """
+        Stops counting live metrics of worker that exited
+    """
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,9 +1,14 @@
 import os
-from typing import TypeVar
-from models import User, Species, Country, City
+from typing import List, Tuple, TypeVar
+from models import db, User, Species, Country, City, CitySpeciesCount
+from models import Notification, User_Species, normalize_city_name
+from sqlalchemy.exc import IntegrityError
 
 UserOrNone = TypeVar("UserOrNone", User, None)
 MATCH_NUM = int(os.environ.get("MATCH_NUM", 10))
+NOTIFICATION_TEMPLATE = \
+    "Congratulations! You and {num_of_others} other people in {city}, \
+{country} have {species} in their lists!  Here is a list of the other users:"
 
 def create_user(
     username: str,
@@ -23,87 +28,49 @@ def create_user(
         :rtype: User | None
     """
 
-    country_code = country
-    city_name = city
-    country_id = None
-    city_id = None
-
-    # country must be in db cause selected by user
-    country = Country.query.filter_by(code=country_code).one()
-    country_id = country.id
-
-    city = City.query.filter_by(name=city_name).one_or_none()
-    # if the city is in db, get its id
-    if city:
-        city_id = city.id
-    # otherwise, add city to db
-    else:
-        city = City(name=city_name, country_id=country_id)
-        db.session.add(city)
-        db.session.commit()
-        city_id = city.id
+    # get city in the country, adding it to db if it's new, which is saved
+    # along with user
+    city_id = City.resolve(city, country)
 
     # add user to db
     return User.signup(username, email, password, city_id)
 
-def edit_profile(user_id: int, username: str, email: str, city: str, country: str) -> None:
+def edit_profile(user_id: int, username: str, email: str, city: str, \
+    country: str) -> bool:
     """
-        Edits profile of user with id user_id
-        :type user_id: in
+        Edits profile of user with id user_id, saving all changes at once.
+        Returns True if profile was edited, or False if nothing was changed
+        because username or email is already taken.
+        :type user_id: int
         :type username: str
         :type email: str
         :type city: str
         :type country: str
+        :rtype: bool
     """
 
-    user = User.query.get(user_id)
-    user.username = username
-    user.email = email
-    db.session.add(user)
-    db.session.commit()
+    user = User.get_with_city(user_id)
 
     country_code = country
     city_name = city
-    country_id =  None
-    city_id = None
-    if user.city.country.code == country_code:
-        country_id = user.city.country.id
-    if user.city.name == city_name:
-        city_id = user.city.id
-
-    if country_id:
-        country = Country.query.get(country_id)
-        # if city has changed, check if in country
-        if not city_id:
-            city_id_list = [city.id for city in country.cities if \
-                city.name == city_name]
-            if city_id_list:
-                # should only be 1 city with that name in the country
-                city_id = city_id_list[0]
-                user.city_id = city_id
-                db.session.add(user)
-                db.session.commit()
-            # otherwise need to add city to db
-            else:
-                city = City(name=city_name, country_id=country_id)
-                db.session.add(city)
-                db.session.commit()
-                city_id = city.id
-                user.city_id = city_id
-                db.session.add(user)
-                db.session.commit()
-    # if country has changed, get new country and city
-    else:
-        country = Country.query.filter_by(code=country_code).one()
-        country_id = country.id
-        # even if city hasn't changed, since in different country, need to add
-        city = City(name=city_name, country_id=country_id)
-        db.session.add(city)
-        db.session.commit()
-        city_id = city.id
-        user.city_id = city_id
-        db.session.add(user)
+    # if city or country has changed, get new city, adding it if needed. This
+    # is done before changing user, so a taken username or email isn't
+    # flushed by the queries it makes
+    city_id = user.city_id
+    if user.city.normalized_name != normalize_city_name(city_name) or \
+        user.city.country.code != country_code:
+        city_id = City.resolve(city_name, country_code)
+
+    user.username = username
+    user.email = email
+    user.city_id = city_id
+    db.session.add(user)
+    try:
         db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
 
 def is_match(species_id: int, city_id: int) -> bool:
     """
@@ -114,16 +81,51 @@ def is_match(species_id: int, city_id: int) -> bool:
         :rtype: bool
     """
 
-    city = City.query.get(city_id)
-    num_of_users = 0
-    # count number of users in city that have species with id species.id
-    for user in city.users:
-        for species in user.species:
-            if species.id == species_id:
-                num_of_users += 1
+    # number of users in city that have species with id species_id is kept
+    # up to date whenever users' lists or cities change
+    num_of_users = CitySpeciesCount.get_count(city_id, species_id)
     result = num_of_users == MATCH_NUM
     return result
 
+def get_notification_parts(
+    species_id: int,
+    city_id: int
+) -> Tuple[str, List[Tuple[int, str, str]]]:
+    """
+        Gets text shared by every notification about species with id
+        species_id in city with id city_id, and (user id, email, line) for each
+        user in the city who has the species in their list
+        :type species_id: int
+        :type city_id: int
+        :rtype: (str, list)
+    """
+
+    (species_name, city_name, country_id) = db.session.query(
+        Species.name,
+        City.name,
+        City.country_id
+    ).filter(
+        Species.id == species_id,
+        City.id == city_id
+    ).one()
+    header = NOTIFICATION_TEMPLATE.format(
+        num_of_others=MATCH_NUM - 1,
+        city=city_name,
+        country=Country.get_name(country_id),
+        species=species_name
+    )
+    # get all users in the city who have the species at once
+    users = db.session.query(User.id, User.username, User.email).join(
+        User_Species,
+        User_Species.user_id == User.id
+    ).filter(
+        User_Species.species_id == species_id,
+        User.city_id == city_id
+    ).order_by(User.id).all()
+    lines = [(id, email, f"\n{username} ({email})") for \
+        (id, username, email) in users]
+    return header, lines
+
 def make_notification(species_id: int, user_id: int) -> str:
     """
         Generate message that shares all users other than user with id user_id
@@ -134,15 +136,26 @@ def make_notification(species_id: int, user_id: int) -> str:
         :rtype: str
     """
 
-    user = User.query.get(user_id)
-    species = Species.query.get(species_id)
-    city_id = user.city_id
-    notification = \
-        f"Congratulations! You and {MATCH_NUM - 1} other people in \
-{user.city.name}, {user.city.country.name} have {species.name} in their \
-lists!  Here is a list of the other users:"
-    # add users other than user with id user_id in city with id city_id to list
-    for user in species.users:
-        if user.city_id == city_id and user.id != user_id:
-            notification += f"\n{user.username} ({user.email})"
-    return notification
\ No newline at end of file
+    city_id = db.session.query(User.city_id).filter(User.id == user_id).scalar()
+    header, lines = get_notification_parts(species_id, city_id)
+    return header + "".join([line for (id, email, line) in lines if \
+        id != user_id])
+
+def queue_notifications(species_id: int, city_id: int) -> None:
+    """
+        Queues an email for each user in city with id city_id who has species
+        with id species_id in their list, letting them know about each other.
+        Emails are sent by worker.py.
+        :type species_id: int
+        :type city_id: int
+    """
+
+    # text is built once, then each user gets it without their own line
+    header, lines = get_notification_parts(species_id, city_id)
+    texts = [line for (id, email, line) in lines]
+    notifications = [Notification(
+        recipient=email,
+        body=header + "".join(texts[:i]) + "".join(texts[i + 1:])
+    ) for i, (id, email, line) in enumerate(lines)]
+    db.session.add_all(notifications)
+    db.session.commit()
@@ -0,0 +1,90 @@
+from flask import Flask, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import metrics
+import json
+import logging
+import time
+
+logger = logging.getLogger("instrumentation")
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, \
+    executemany) -> None:
+    """
+        Notes when query sent during a request started. The time is kept on
+        the query's execution context, so it goes away with the query even if
+        the query fails.
+    """
+
+    if has_request_context() and context is not None:
+        context.query_start_time = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_query_timer(conn, cursor, statement, parameters, context, \
+    executemany) -> None:
+    """
+        Adds query sent during a request to the request's count and db time
+    """
+
+    start_time = getattr(context, "query_start_time", None)
+    if has_request_context() and start_time is not None:
+        g.db_queries = g.get("db_queries", 0) + 1
+        g.db_time = g.get("db_time", 0) + time.perf_counter() - start_time
+
+def start_request_timer() -> None:
+    """
+        Resets query count and db time, and notes when request started
+    """
+
+    g.request_start_time = time.perf_counter()
+    g.db_queries = 0
+    g.db_time = 0
+
+def report_request_timing(response):
+    """
+        Adds number of queries, db time, and total time of request to
+        response's Server-Timing header, and logs them as one JSON line
+        :type response: Response
+        :rtype: Response
+    """
+
+    start_time = g.get("request_start_time", None)
+    if start_time is None:
+        return response
+    duration_ms = (time.perf_counter() - start_time) * 1000
+    db_queries = g.get("db_queries", 0)
+    db_ms = g.get("db_time", 0) * 1000
+    metrics.observe_request(
+        request.endpoint,
+        request.method,
+        response.status_code,
+        duration_ms / 1000
+    )
+    response.headers.add(
+        "Server-Timing",
+        f'db;desc="{db_queries} queries";dur={db_ms:.1f}, \
+app;dur={duration_ms:.1f}'
+    )
+    logger.info(json.dumps({
+        "endpoint": request.endpoint,
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        "db_queries": db_queries,
+        "db_ms": round(db_ms, 1),
+        "duration_ms": round(duration_ms, 1)
+    }))
+    return response
+
+def init_app(app: Flask) -> None:
+    """
+        Reports query count and timing of every request to app
+        :type app: Flask
+    """
+
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+    app.before_request(start_request_timer)
+    app.after_request(report_request_timing)
@@ -0,0 +1,318 @@
+from __future__ import annotations
+import os
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cache import DiskCache
+from resilience import CircuitBreaker, TokenBucket
+import json
+import metrics
+import sqlite3
+import tempfile
+import time
+
+TOKEN = os.environ.get("TOKEN")
+BASE_URL = os.environ.get(
+    "IUCN_BASE_URL",
+    "https://apiv3.iucnredlist.org/api/v3/"
+)
+
+# seconds to wait for a connection to the API, and then for its response
+CONNECT_TIMEOUT = float(os.environ.get("IUCN_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.environ.get("IUCN_READ_TIMEOUT", 10))
+MAX_RETRIES = int(os.environ.get("IUCN_MAX_RETRIES", 2))
+BACKOFF_FACTOR = float(os.environ.get("IUCN_BACKOFF_FACTOR", 0.3))
+POOL_SIZE = int(os.environ.get("IUCN_POOL_SIZE", 10))
+# calls a second allowed on average across all workers on the host, calls
+# allowed at once, and seconds a call may wait for its turn. A rate of 0 turns
+# off the rate limit.
+RATE_LIMIT = float(os.environ.get("IUCN_RATE_LIMIT", 10))
+RATE_BURST = float(os.environ.get("IUCN_RATE_BURST", 20))
+RATE_LIMIT_WAIT = float(os.environ.get("IUCN_RATE_LIMIT_WAIT", 1))
+RATE_LIMIT_PATH = os.environ.get(
+    "IUCN_RATE_LIMIT_PATH",
+    os.path.join(tempfile.gettempdir(), "iucn-rate-limit.sqlite3")
+)
+# responses are kept in a file shared by all workers on the host for
+# CACHE_TTL seconds, up to CACHE_MAX_BYTES. A ttl of 0 turns off the cache.
+CACHE_TTL = float(os.environ.get("IUCN_CACHE_TTL", 86400))
+CACHE_MAX_BYTES = int(os.environ.get("IUCN_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+CACHE_PATH = os.environ.get(
+    "IUCN_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "iucn-cache.sqlite3")
+)
+# share of latest calls that must fail before calls stop, how many latest
+# calls are looked at, and seconds before a call is tried again
+BREAKER_THRESHOLD = float(os.environ.get("IUCN_BREAKER_THRESHOLD", 0.5))
+BREAKER_WINDOW = int(os.environ.get("IUCN_BREAKER_WINDOW", 20))
+BREAKER_MIN_CALLS = int(os.environ.get("IUCN_BREAKER_MIN_CALLS", 10))
+BREAKER_RESET = float(os.environ.get("IUCN_BREAKER_RESET", 30))
+
+class IUCNError(Exception):
+    """
+        Exception for errors with calling the Red List API
+    """
+
+    def __init__(self, message: str) -> None:
+        """
+            Constructor for IUCNError
+            :type message: str
+        """
+
+        self.message = message
+        super().__init__(self.message)
+
+class IUCNUnavailable(IUCNError):
+    """
+        Exception for calls to the Red List API that weren't made, because
+        it's failing or we're over our rate limit
+    """
+
+response_cache = DiskCache(CACHE_PATH, CACHE_TTL, CACHE_MAX_BYTES)
+rate_limiter = TokenBucket(RATE_LIMIT_PATH, "iucn", RATE_LIMIT, RATE_BURST)
+breaker = CircuitBreaker(
+    BREAKER_THRESHOLD,
+    BREAKER_WINDOW,
+    BREAKER_MIN_CALLS,
+    BREAKER_RESET
+)
+
+_session = None
+_session_pid = None
+_executor = None
+_executor_pid = None
+
+def get_session() -> requests.Session:
+    """
+        Gets the session shared by every call to the API from this process, so
+        that connections are kept alive and reused instead of being opened
+        for each call
+        :rtype: requests.Session
+    """
+
+    global _session, _session_pid
+
+    # gunicorn forks workers, so each process needs its own connections
+    if _session is None or _session_pid != os.getpid():
+        retries = Retry(
+            total=MAX_RETRIES,
+            connect=MAX_RETRIES,
+            read=MAX_RETRIES,
+            status=MAX_RETRIES,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+            # Retry-After can ask for any wait, and timeouts don't cover it,
+            # so retries only wait for the backoff
+            respect_retry_after_header=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=POOL_SIZE,
+            pool_maxsize=POOL_SIZE,
+            max_retries=retries
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+        _session_pid = os.getpid()
+    return _session
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+        Gets the thread pool used to make calls to the API concurrently from
+        this process
+        :rtype: ThreadPoolExecutor
+    """
+
+    global _executor, _executor_pid
+
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=POOL_SIZE)
+        _executor_pid = os.getpid()
+    return _executor
+
+def format_name(species_name: str) -> str:
+    """
+        Formats name of species the way the API expects it in a url
+        :type species_name: str
+        :rtype: str
+    """
+
+    return "%20".join(species_name.split(" "))
+
+def get_cached(path: str) -> dict | None:
+    """
+        Gets response for path from the cache shared by all workers, or None
+        if it isn't there. A broken cache counts as a miss.
+        :type path: str
+        :rtype: dict | None
+    """
+
+    try:
+        body = response_cache.get(path)
+    except sqlite3.Error:
+        return None
+    return json.loads(body) if body is not None else None
+
+def set_cached(path: str, data: dict, result_key: str = "result") -> None:
+    """
+        Saves response for path in the cache shared by all workers. Responses
+        without result_key, like errors about the token, aren't saved.
+        :type path: str
+        :type data: dict
+        :type result_key: str
+    """
+
+    if result_key not in data:
+        return
+    try:
+        response_cache.set(path, json.dumps(data))
+    except sqlite3.Error:
+        pass
+
+def get(path: str, endpoint: str, fresh: bool = False, \
+    result_key: str = "result") -> dict:
+    """
+        Calls the API at path and returns the decoded response, or raises an
+        IUCNError if the API can't be reached or gives an invalid response.
+        Responses with result_key, where the endpoint puts its data, are
+        cached unless fresh is True, which always calls the API. Metrics are
+        recorded under endpoint, which leaves out species names.
+        :type path: str
+        :type endpoint: str
+        :type fresh: bool
+        :type result_key: str
+        :rtype: dict
+    """
+
+    if CACHE_TTL and not fresh:
+        data = get_cached(path)
+        metrics.record_cache_lookup("iucn", data is not None)
+        if data is not None:
+            return data
+
+    # fail fast while the API is failing, instead of waiting on it
+    allowed = breaker.allow()
+    metrics.set_iucn_circuit_state(breaker.state)
+    if not allowed:
+        metrics.record_iucn_rejection(endpoint, "circuit_open")
+        raise IUCNUnavailable(
+            "The Red List API is down right now. Please try again later."
+        )
+    if RATE_LIMIT:
+        try:
+            acquired = rate_limiter.acquire(RATE_LIMIT_WAIT)
+        except sqlite3.Error:
+            # a broken or locked limiter counts as being over the limit, so
+            # callers can still fall back to stored responses
+            acquired = False
+    else:
+        acquired = True
+    if not acquired:
+        # call wasn't made, so breaker learns nothing from it
+        breaker.cancel()
+        metrics.record_iucn_rejection(endpoint, "rate_limited")
+        raise IUCNUnavailable(
+            "Too many searches right now. Please try again in a moment."
+        )
+
+    params = { "token": TOKEN }
+    status = "error"
+    success = False
+    start_time = time.perf_counter()
+    try:
+        resp = get_session().get(
+            f"{BASE_URL}{path}",
+            params=params,
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+        )
+        status = str(resp.status_code)
+        resp.raise_for_status()
+        data = resp.json()
+        success = True
+        if CACHE_TTL:
+            set_cached(path, data, result_key)
+        return data
+    except (requests.RequestException, ValueError):
+        raise IUCNError("Could not reach the Red List API")
+    finally:
+        breaker.record(success)
+        metrics.set_iucn_circuit_state(breaker.state)
+        metrics.observe_iucn_call(
+            endpoint,
+            status,
+            time.perf_counter() - start_time
+        )
+
+def species_path(species_name: str) -> str:
+    """
+        Gets path of data on species with name species_name
+        :type species_name: str
+        :rtype: str
+    """
+
+    return f"species/{format_name(species_name)}"
+
+def species_countries_path(species_name: str) -> str:
+    """
+        Gets path of countries species with name species_name is in
+        :type species_name: str
+        :rtype: str
+    """
+
+    return f"species/countries/name/{format_name(species_name)}"
+
+def get_species(species_name: str, fresh: bool = False) -> dict:
+    """
+        Gets data on species with name species_name
+        :type species_name: str
+        :type fresh: bool
+        :rtype: dict
+    """
+
+    return get(species_path(species_name), "species", fresh)
+
+def get_species_countries(species_name: str, fresh: bool = False) -> dict:
+    """
+        Gets countries species with name species_name is in
+        :type species_name: str
+        :type fresh: bool
+        :rtype: dict
+    """
+
+    return get(
+        species_countries_path(species_name),
+        "species/countries/name",
+        fresh
+    )
+
+def get_countries() -> dict:
+    """
+        Gets all countries
+        :rtype: dict
+    """
+
+    # unlike species endpoints, country list puts its data in "results"
+    return get("country/list", "country/list", result_key="results")
+
+def get_species_with_countries(species_name: str, \
+    fresh: bool = False) -> Tuple[dict, dict]:
+    """
+        Gets data on species with name species_name and the countries it's
+        in, calling the API for both at the same time
+        :type species_name: str
+        :type fresh: bool
+        :rtype: (dict, dict)
+    """
+
+    executor = get_executor()
+    species_future = executor.submit(get_species, species_name, fresh)
+    countries_future = executor.submit(
+        get_species_countries,
+        species_name,
+        fresh
+    )
+    return species_future.result(), countries_future.result()
@@ -0,0 +1,165 @@
+from flask import Flask, Response, abort, request
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client import multiprocess, start_http_server
+import hmac
+import os
+
+# gunicorn.conf.py sets this so all workers' metrics can be added together
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+# bearer token scrapers must send to see /metrics; without it only requests
+# from the same host are let in
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+LOCAL_ADDRS = ("127.0.0.1", "::1")
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time taken to handle requests",
+    ["endpoint", "method", "status"]
+)
+
+IUCN_LATENCY = Histogram(
+    "iucn_request_duration_seconds",
+    "Time taken by calls to the Red List API",
+    ["endpoint", "status"]
+)
+
+IUCN_REJECTED = Counter(
+    "iucn_rejected_calls_total",
+    "Calls to the Red List API skipped by rate limit or open circuit",
+    ["endpoint", "reason"]
+)
+
+# worst state of any worker's circuit breaker: 0 closed, 1 half open, 2 open
+IUCN_CIRCUIT_STATE = Gauge(
+    "iucn_circuit_breaker_state",
+    "State of circuit breaker around calls to the Red List API",
+    multiprocess_mode="max"
+)
+CIRCUIT_STATES = { "closed": 0, "half_open": 1, "open": 2 }
+
+SMTP_LATENCY = Histogram(
+    "smtp_send_duration_seconds",
+    "Time taken to send an email to the mail server",
+    ["outcome"]
+)
+
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Lookups in each cache, and whether they were found",
+    ["cache", "result"]
+)
+
+def observe_request(endpoint: str, method: str, status: int, \
+    seconds: float) -> None:
+    """
+        Records time taken to handle a request
+        :type endpoint: str
+        :type method: str
+        :type status: int
+        :type seconds: float
+    """
+
+    REQUEST_LATENCY.labels(endpoint or "none", method, str(status)).observe(
+        seconds
+    )
+
+def observe_iucn_call(endpoint: str, status: str, seconds: float) -> None:
+    """
+        Records time taken by a call to the Red List API
+        :type endpoint: str
+        :type status: str
+        :type seconds: float
+    """
+
+    IUCN_LATENCY.labels(endpoint, status).observe(seconds)
+
+def record_iucn_rejection(endpoint: str, reason: str) -> None:
+    """
+        Records a call to the Red List API that wasn't made
+        :type endpoint: str
+        :type reason: str
+    """
+
+    IUCN_REJECTED.labels(endpoint, reason).inc()
+
+def set_iucn_circuit_state(state: str) -> None:
+    """
+        Records state of circuit breaker around calls to the Red List API
+        :type state: str
+    """
+
+    IUCN_CIRCUIT_STATE.set(CIRCUIT_STATES[state])
+
+def observe_smtp_send(outcome: str, seconds: float) -> None:
+    """
+        Records time taken to send an email
+        :type outcome: str
+        :type seconds: float
+    """
+
+    SMTP_LATENCY.labels(outcome).observe(seconds)
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    """
+        Records whether a lookup in cache found what it was looking for
+        :type cache: str
+        :type hit: bool
+    """
+
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+def get_registry() -> CollectorRegistry:
+    """
+        Gets registry with all metrics, added up across every worker process
+        if there are several
+        :rtype: CollectorRegistry
+    """
+
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def is_allowed() -> bool:
+    """
+        Checks if current request may see metrics
+        :rtype: bool
+    """
+
+    if not METRICS_TOKEN:
+        return request.remote_addr in LOCAL_ADDRS
+    authorization = request.headers.get("Authorization", "")
+    return hmac.compare_digest(authorization, f"Bearer {METRICS_TOKEN}")
+
+def show_metrics() -> Response:
+    """
+        Shows all metrics in Prometheus text format, added up across every
+        worker process
+        :rtype: Response
+    """
+
+    if not is_allowed():
+        abort(403)
+    data = generate_latest(get_registry())
+    return Response(data, mimetype=CONTENT_TYPE_LATEST)
+
+def serve_metrics(port: int, addr: str = "127.0.0.1") -> None:
+    """
+        Serves metrics of a process that isn't a web worker, like the
+        notification worker, on its own port in a background thread. There's
+        no token check there, so it only listens on addr.
+        :type port: int
+        :type addr: str
+    """
+
+    start_http_server(port, addr=addr, registry=get_registry())
+
+def init_app(app: Flask) -> None:
+    """
+        Adds /metrics page to app
+        :type app: Flask
+    """
+
+    app.add_url_rule("/metrics", "show_metrics", show_metrics)
@@ -0,0 +1,91 @@
+"""initial schema
+
+Schema the app had before migrations, as made by db.create_all(). Existing
+databases should be marked as being at this revision with
+`flask db stamp 0001` before running `flask db upgrade`.
+
+Revision ID: 0001
+Revises: 
+Create Date: 2021-02-01 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'countries',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('name', sa.Text(), nullable=False),
+        sa.Column('code', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('code'),
+        sa.UniqueConstraint('name')
+    )
+    op.create_table(
+        'species',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('name', sa.Text(), nullable=False),
+        sa.Column('threatened', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    op.create_table(
+        'cities',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('name', sa.Text(), nullable=False),
+        sa.Column('country_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['country_id'], ['countries.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'species_countries',
+        sa.Column('species_id', sa.Integer(), nullable=False),
+        sa.Column('country_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['country_id'], ['countries.id'], ondelete='cascade'
+        ),
+        sa.ForeignKeyConstraint(
+            ['species_id'], ['species.id'], ondelete='cascade'
+        ),
+        sa.PrimaryKeyConstraint('species_id', 'country_id')
+    )
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('username', sa.Text(), nullable=False),
+        sa.Column('email', sa.Text(), nullable=False),
+        sa.Column('password', sa.Text(), nullable=False),
+        sa.Column('city_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['city_id'], ['cities.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('username')
+    )
+    op.create_table(
+        'users_species',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('species_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['species_id'], ['species.id'], ondelete='cascade'
+        ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='cascade'),
+        sa.PrimaryKeyConstraint('user_id', 'species_id')
+    )
+
+
+def downgrade():
+    op.drop_table('users_species')
+    op.drop_table('users')
+    op.drop_table('species_countries')
+    op.drop_table('cities')
+    op.drop_table('species')
+    op.drop_table('countries')
@@ -0,0 +1,64 @@
+"""missing species, city species counts, and notifications
+
+Adds the negative cache of species names, the counts of users in each city
+with each species (filled in from users' current lists), and the queue of
+notification emails.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2021-02-01 12:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'missing_species',
+        sa.Column('name', sa.Text(), nullable=False),
+        sa.Column('checked_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table(
+        'city_species_counts',
+        sa.Column('city_id', sa.Integer(), nullable=False),
+        sa.Column('species_id', sa.Integer(), nullable=False),
+        sa.Column('num_of_users', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['city_id'], ['cities.id'], ondelete='cascade'),
+        sa.ForeignKeyConstraint(
+            ['species_id'], ['species.id'], ondelete='cascade'
+        ),
+        sa.PrimaryKeyConstraint('city_id', 'species_id')
+    )
+    op.execute(
+        'INSERT INTO city_species_counts (city_id, species_id, num_of_users) '
+        'SELECT users.city_id, users_species.species_id, count(*) '
+        'FROM users_species JOIN users ON users.id = users_species.user_id '
+        'GROUP BY users.city_id, users_species.species_id'
+    )
+    op.create_table(
+        'notifications',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('recipient', sa.Text(), nullable=False),
+        sa.Column('subject', sa.Text(), nullable=False),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('notifications')
+    op.drop_table('city_species_counts')
+    op.drop_table('missing_species')
@@ -0,0 +1,44 @@
+"""performance indexes
+
+Indexes foreign keys and city names used by lookups and joins. Indexes are
+built with CREATE INDEX CONCURRENTLY so tables stay writable on a live
+database, which Postgres only allows outside a transaction.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2021-02-01 12:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# same names db.create_all() gives columns with index=True
+INDEXES = [
+    ('ix_cities_name', 'cities', 'name'),
+    ('ix_cities_country_id', 'cities', 'country_id'),
+    ('ix_users_city_id', 'users', 'city_id'),
+    ('ix_users_species_species_id', 'users_species', 'species_id'),
+    ('ix_species_countries_country_id', 'species_countries', 'country_id')
+]
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for (name, table, column) in INDEXES:
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                f'ON {table} ({column})'
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for (name, table, column) in INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
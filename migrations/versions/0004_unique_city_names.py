@@ -0,0 +1,74 @@
+"""unique city names
+
+Adds the normalized city name and makes it unique within each country, so a
+city is only ever added once. Duplicate cities already in the table are
+merged into the oldest one first, and counts of users in each city with each
+species are rebuilt to match. The unique index is built concurrently, outside
+a transaction, and then used for the constraint.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2021-02-08 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+CONSTRAINT = 'uq_cities_country_id_normalized_name'
+
+
+def upgrade():
+    op.add_column(
+        'cities',
+        sa.Column('normalized_name', sa.Text(), nullable=True)
+    )
+    # same as models.normalize_city_name
+    op.execute(
+        "UPDATE cities SET normalized_name = "
+        "lower(regexp_replace(btrim(name), '\\s+', ' ', 'g'))"
+    )
+    # point users at oldest city with the same name, then drop the others
+    op.execute(
+        'UPDATE users SET city_id = keep.id '
+        'FROM ('
+        'SELECT id AS city_id, min(id) OVER '
+        '(PARTITION BY country_id, normalized_name) AS id FROM cities'
+        ') AS keep '
+        'WHERE users.city_id = keep.city_id AND keep.city_id <> keep.id'
+    )
+    op.execute(
+        'DELETE FROM cities USING cities AS kept '
+        'WHERE cities.country_id = kept.country_id '
+        'AND cities.normalized_name = kept.normalized_name '
+        'AND cities.id > kept.id'
+    )
+    op.execute('DELETE FROM city_species_counts')
+    op.execute(
+        'INSERT INTO city_species_counts (city_id, species_id, num_of_users) '
+        'SELECT users.city_id, users_species.species_id, count(*) '
+        'FROM users_species JOIN users ON users.id = users_species.user_id '
+        'GROUP BY users.city_id, users_species.species_id'
+    )
+    op.alter_column('cities', 'normalized_name', nullable=False)
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {CONSTRAINT} '
+            'ON cities (country_id, normalized_name)'
+        )
+        op.execute(
+            f'ALTER TABLE cities ADD CONSTRAINT {CONSTRAINT} '
+            f'UNIQUE USING INDEX {CONSTRAINT}'
+        )
+
+
+def downgrade():
+    op.drop_constraint(CONSTRAINT, 'cities', type_='unique')
+    op.drop_column('cities', 'normalized_name')
@@ -0,0 +1,41 @@
+"""species fetched at
+
+Records when each species was last fetched from the Red List API, so stale
+data can be refreshed. Species already in the table were fetched at an
+unknown time, so they start out stale and are refreshed as they're looked up
+or by flask refresh-species.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2021-02-15 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'species',
+        sa.Column('fetched_at', sa.DateTime(), nullable=True)
+    )
+    op.execute("UPDATE species SET fetched_at = 'epoch'::timestamp")
+    op.alter_column('species', 'fetched_at', nullable=False)
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_species_fetched_at '
+            'ON species (fetched_at)'
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_species_fetched_at')
+    op.drop_column('species', 'fetched_at')
@@ -0,0 +1,33 @@
+"""iucn responses
+
+Adds the store of Red List API responses about species, used to find species
+while the API is down.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2021-02-22 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'iucn_responses',
+        sa.Column('path', sa.Text(), nullable=False),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('fetched_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('path')
+    )
+
+
+def downgrade():
+    op.drop_table('iucn_responses')
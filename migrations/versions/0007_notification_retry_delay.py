@@ -0,0 +1,35 @@
+"""notification retry delay
+
+Records when each notification may next be tried, so failed notifications
+wait longer after each attempt instead of being retried right away.
+Notifications already queued are due now.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2021-03-01 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'notifications',
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=True)
+    )
+    op.execute(
+        "UPDATE notifications SET next_attempt_at = timezone('utc', now())"
+    )
+    op.alter_column('notifications', 'next_attempt_at', nullable=False)
+
+
+def downgrade():
+    op.drop_column('notifications', 'next_attempt_at')
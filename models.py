@@ -1,16 +1,56 @@
 from __future__ import annotations
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import IntegrityError
-import requests
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.attributes import get_history
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Lock
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Tuple
+from cache import SingleFlight, TTLCache
+from iucn import TOKEN, BASE_URL
+import iucn
+import metrics
+import passwords
+import json
 import os
 
-TOKEN = os.environ.get("TOKEN")
-BASE_URL = "https://apiv3.iucnredlist.org/api/v3/"
+# seconds to remember that the API doesn't know a species name
+NEGATIVE_CACHE_TTL = int(os.environ.get("NEGATIVE_CACHE_TTL", 86400))
+NEGATIVE_CACHE_SIZE = int(os.environ.get("NEGATIVE_CACHE_SIZE", 10000))
+NOTIFICATION_SUBJECT = "Threatened Species Website"
+# seconds before species data is fetched from the API again. Older data is
+# still shown while it's refreshed in the background.
+SPECIES_MAX_AGE = int(os.environ.get("SPECIES_MAX_AGE", 30 * 86400))
+# species each worker refreshes at once in the background, and most species
+# waiting to be refreshed
+REFRESH_WORKERS = int(os.environ.get("SPECIES_REFRESH_WORKERS", 2))
+REFRESH_QUEUE_SIZE = int(os.environ.get("SPECIES_REFRESH_QUEUE_SIZE", 100))
+# countries shipped with the app, in the same format the API gives them
+COUNTRY_SNAPSHOT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "data",
+    "countries.json"
+)
 
 db = SQLAlchemy()
 
-bcrypt = Bcrypt()
+missing_species_cache = TTLCache(NEGATIVE_CACHE_SIZE, NEGATIVE_CACHE_TTL)
+# lookups of species from external API that are running in this process
+species_fetches = SingleFlight()
+
+# countries almost never change, so each worker keeps them in memory
+_country_registry = None
+
+# names of species being refreshed in the background by this process
+_refreshing = set()
+_refreshing_lock = Lock()
+_refresh_executor = None
+_refresh_executor_pid = None
 
 class SpeciesError(Exception):
     """
@@ -26,6 +66,12 @@ class SpeciesError(Exception):
         self.message = message
         super().__init__(self.message)
 
+class SpeciesUnavailable(SpeciesError):
+    """
+        Exception for species that can't be looked up right now, because the
+        Red List API can't be reached and nothing about them is stored
+    """
+
 class CountryError(Exception):
     """
         Exception for errors with using Country models
@@ -40,6 +86,37 @@ class CountryError(Exception):
         self.message = message
         super().__init__(self.message)
 
+def get_refresh_executor() -> ThreadPoolExecutor:
+    """
+        Gets the thread pool this process uses to refresh species in the
+        background
+        :rtype: ThreadPoolExecutor
+    """
+
+    global _refresh_executor, _refresh_executor_pid
+
+    # gunicorn forks workers, so each process needs its own threads
+    if _refresh_executor is None or _refresh_executor_pid != os.getpid():
+        _refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS)
+        _refresh_executor_pid = os.getpid()
+    return _refresh_executor
+
+def refresh_species(app: Flask, species_name: str) -> bool:
+    """
+        Refreshes species with name species_name from the API, outside of any
+        request. Returns True if species was refreshed.
+        :type app: Flask
+        :type species_name: str
+        :rtype: bool
+    """
+
+    with app.app_context():
+        try:
+            return Species.refresh(species_name)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(species_name)
+
 def connect_db(app) -> None:
     """
         Connects app to db
@@ -67,7 +144,8 @@ class User(db.Model):
 
     city_id = db.Column(
         db.ForeignKey("cities.id"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     species = db.relationship(
@@ -85,6 +163,34 @@ class User(db.Model):
         return f"<User id={self.id} username={self.username} \
 email={self.email} password={self.password} city_id={self.city_id}>"
 
+    @classmethod
+    def get_with_city(cls, user_id: int) -> User | None:
+        """
+            Gets user with id user_id along with their city and country, in one
+            query
+            :type user_id: int
+            :rtype: User | None
+        """
+
+        return cls.query.options(
+            joinedload(cls.city).joinedload(City.country)
+        ).get(user_id)
+
+    @classmethod
+    def get_with_species(cls, user_id: int) -> User | None:
+        """
+            Gets user with id user_id along with their city, country, and list
+            of species, in two queries no matter how many species are in the
+            list
+            :type user_id: int
+            :rtype: User | None
+        """
+
+        return cls.query.options(
+            joinedload(cls.city).joinedload(City.country),
+            selectinload(cls.species)
+        ).get(user_id)
+
     @classmethod
     def signup(cls, username: str, email: str, password: str, \
         city_id: int) -> User | None:
@@ -99,8 +205,7 @@ email={self.email} password={self.password} city_id={self.city_id}>"
         """
 
         # first encrypt password
-        hashed_password = \
-            bcrypt.generate_password_hash(password).decode("utf8")
+        hashed_password = passwords.hash_password(password)
 
         user = cls(
             username=username,
@@ -130,13 +235,19 @@ email={self.email} password={self.password} city_id={self.city_id}>"
         if (user):
             hashed_password = user.password
 
-            if (bcrypt.check_password_hash(hashed_password, password)):
+            if (passwords.check_password(hashed_password, password)):
+                # if number of rounds changed, update hash while we have the
+                # password
+                if passwords.needs_rehash(hashed_password):
+                    user.password = passwords.hash_password(password)
+                    db.session.commit()
                 return user
         return None
 
 class Species(db.Model):
     """
-        Schema for species. Has species' id, name and threatened level.
+        Schema for species. Has species' id, name, threatened level, and when
+        its data was last fetched from the API.
     """
 
     __tablename__ = "species"
@@ -147,6 +258,13 @@ class Species(db.Model):
 
     threatened = db.Column(db.Text, nullable=False)
 
+    fetched_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        index=True
+    )
+
     countries = db.relationship(
         "Country",
         secondary="species_countries",
@@ -173,57 +291,235 @@ threatened={self.threatened}>'
             :rtype: Species | None
         """
 
-        # keep all letters lowercase for consistency in db
-        species_name = species_name.lower()
+        species = cls.lookup(species_name)
+        # if species is in the country the user is in
+        if species.in_country(country_id):
+            return species
+        # if species exists but not in country, raise exception
+        error_message = "that species is not in your country"
+        raise SpeciesError(error_message)
+
+    @classmethod
+    def lookup(cls, species_name: str) -> Species:
+        """
+            Gets species with name species_name from db, or from external API
+            if it isn't in db yet. Raises SpeciesError if species can't be
+            found.
+            :type species_name: str
+            :rtype: Species
+        """
+
+        # keep all letters lowercase and single spaced for consistency in db
+        species_name = " ".join(species_name.split()).lower()
         species = cls.query.filter_by(name=species_name).one_or_none()
-        # if in db and species is in the country the user is in
+        metrics.record_cache_lookup("species", species is not None)
         if species:
-            if [country for country in species.countries if \
-                country.id == country_id]:
-                return species
-            # if species exists but not in country, raise exception
-            error_message = "that species is not in your country"
+            # old data is good enough for now, and updated for next time
+            if species.is_stale():
+                species.schedule_refresh()
+            return species
+        # users searching for the same new species at the same time share
+        # one request to external API
+        species_id = species_fetches.do(species_name, cls.fetch, species_name)
+        return cls.query.get(species_id)
+
+    @classmethod
+    def fetch(cls, species_name: str) -> int:
+        """
+            Gets species with name species_name from external API and saves it
+            along with the countries it's in. Returns id of species. Raises
+            SpeciesError if species can't be found, or SpeciesUnavailable if
+            the external API can't be asked about it right now.
+            :type species_name: str
+            :rtype: int
+        """
+
+        # don't ask external API again for a name it recently didn't know
+        error_message = "Could not find species"
+        if MissingSpecies.is_missing(species_name):
             raise SpeciesError(error_message)
-        # otherwise, pull from external API
-        name_supported_format = "%20".join(species_name.split(" "))
-        params = { "token": TOKEN }
         try:
-            resp = requests.get(
-                f"{BASE_URL}species/{name_supported_format}",
-                params=params
+            # get species and the countries it's in at the same time, or what
+            # the API last said about them if it's down
+            data, countries_data, fetched_at = \
+                IUCNResponse.get_species_with_countries(species_name)
+        except iucn.IUCNUnavailable as exc:
+            # let user know to try again, rather than that species is unknown
+            raise SpeciesUnavailable(exc.message)
+        except iucn.IUCNError:
+            raise SpeciesUnavailable(
+                "Could not reach the Red List API. Please try again later."
             )
-            data = resp.json()
+        # error bodies, e.g. for a bad token, say nothing about the species
+        if not isinstance(data, dict) or "result" not in data:
+            raise SpeciesError(error_message)
+        if not data["result"]:
+            MissingSpecies.remember(species_name)
+            raise SpeciesError(error_message)
+        try:
             name = data["name"]
+            threatened = data["result"][0]["category"]
+            codes = [country["code"] for country in countries_data["result"]]
+        except (KeyError, IndexError, TypeError):
+            raise SpeciesError(error_message)
+        return cls.save(name, threatened, codes, fetched_at)
+
+    @classmethod
+    def save(cls, name: str, threatened: str, codes: list, \
+        fetched_at: datetime = None) -> int:
+        """
+            Adds species with name, threatened level, and codes of countries
+            it's in to db, unless another worker already added it. Returns id
+            of species. fetched_at is when data came from the API, if not now.
+            :type name: str
+            :type threatened: str
+            :type codes: list
+            :type fetched_at: datetime
+            :rtype: int
+        """
 
-            result = data["result"]
-            threatened = result[0]["category"]
-            species = cls(name=name, threatened=threatened)
-            db.session.add(species)
+        stmt = insert(cls).values(
+            name=name,
+            threatened=threatened,
+            fetched_at=fetched_at or datetime.utcnow()
+        ).on_conflict_do_nothing(
+            index_elements=[cls.name]
+        ).returning(cls.id)
+        species_id = db.session.execute(stmt).scalar()
+        if species_id is None:
+            # another worker added it first, which waited for it to be
+            # committed along with its countries
+            species_id = db.session.query(cls.id).filter_by(name=name).scalar()
             db.session.commit()
+            return species_id
+        species = cls.query.get(species_id)
+        species.add_countries(codes)
+        db.session.commit()
+        return species_id
 
-            # add countries species is in
-            resp = requests.get(
-                f"{BASE_URL}species/countries/name/{name_supported_format}",
-                params=params
-            )
-            data = resp.json()
-            result = data["result"]
-            for country in result:
-                code = country["code"]
-                country = Country.query.filter_by(code=code).one()
-                species.countries.append(country)
+    def in_country(self, country_id: int) -> bool:
+        """
+            Checks if species is in country with id country_id
+            :type country_id: int
+            :rtype: bool
+        """
+
+        return any(country.id == country_id for country in self.countries)
+
+    def is_stale(self) -> bool:
+        """
+            Checks if species data is old enough to be fetched again
+            :rtype: bool
+        """
+
+        max_age = timedelta(seconds=SPECIES_MAX_AGE)
+        return datetime.utcnow() - self.fetched_at > max_age
+
+    def schedule_refresh(self) -> bool:
+        """
+            Refreshes species in the background, unless it's already being
+            refreshed or too many species are waiting to be. Returns True if
+            refresh was scheduled.
+            :rtype: bool
+        """
+
+        with _refreshing_lock:
+            if self.name in _refreshing or \
+                len(_refreshing) >= REFRESH_QUEUE_SIZE:
+                return False
+            _refreshing.add(self.name)
+        # app of current request, or the one db was connected to outside one
+        app = db.get_app()
+        get_refresh_executor().submit(refresh_species, app, self.name)
+        return True
+
+    @classmethod
+    def refresh(cls, species_name: str) -> bool:
+        """
+            Fetches threatened level and countries of species with name
+            species_name from the API again and saves them. If the API can't be
+            reached, keeps the old data. Returns True if species was updated.
+            :type species_name: str
+            :rtype: bool
+        """
+
+        species = cls.query.filter_by(name=species_name).one_or_none()
+        if species is None:
+            return False
+        try:
+            # stored responses are no newer than what species already has
+            data, countries_data, fetched_at = \
+                IUCNResponse.get_species_with_countries(
+                    species_name,
+                    serve_stale=False
+                )
+        except iucn.IUCNError:
+            # try again next time species is looked up
+            return False
+        try:
+            threatened = data["result"][0]["category"]
+            codes = [country["code"] for country in countries_data["result"]]
+        except (KeyError, IndexError, TypeError):
+            # keep what we have, but don't ask again until it's stale again
+            species.fetched_at = datetime.utcnow()
             db.session.commit()
+            return False
+        species.threatened = threatened
+        species.fetched_at = fetched_at
+        species.set_countries(codes)
+        db.session.commit()
+        return True
 
-        except:
-            db.session.rollback()
-            error_message = "Could not find species"
-            raise SpeciesError(error_message)
-        if [country for country in species.countries if \
-            country.id == country_id]:
-            return species
-        # if species exists but not in country, raise exception
-        error_message = "that species is not in your country"
-        raise SpeciesError(error_message)
+    @classmethod
+    def get_stale_names(cls, limit: int) -> list:
+        """
+            Gets names of up to limit species whose data is old enough to be
+            fetched again, oldest first
+            :type limit: int
+            :rtype: list
+        """
+
+        fetched_before = datetime.utcnow() - timedelta(seconds=SPECIES_MAX_AGE)
+        names = db.session.query(cls.name).filter(
+            cls.fetched_at < fetched_before
+        ).order_by(cls.fetched_at).limit(limit).all()
+        return [name for (name,) in names]
+
+    def set_countries(self, codes: list) -> None:
+        """
+            Links species to exactly the countries with codes in codes,
+            removing links to countries it's no longer in. Doesn't commit.
+            :type codes: list
+        """
+
+        country_ids = list(Country.get_ids(codes).values())
+        Species_Country.query.filter(
+            Species_Country.species_id == self.id,
+            ~Species_Country.country_id.in_(country_ids)
+        ).delete(synchronize_session=False)
+        self.add_countries(codes)
+        db.session.expire(self, ["countries"])
+
+    def add_countries(self, codes: list) -> None:
+        """
+            Links species to countries with codes in codes, looking up all
+            countries in the registry and inserting all links in one
+            statement. Codes of countries not in db are skipped. Doesn't
+            commit.
+            :type codes: list
+        """
+
+        if not codes:
+            return
+        country_ids = Country.get_ids(codes).values()
+        if country_ids:
+            stmt = insert(Species_Country).values([
+                { "species_id": self.id, "country_id": country_id } for \
+                    country_id in country_ids
+            ]).on_conflict_do_nothing()
+            db.session.execute(stmt)
+        # relationship needs to be reloaded to see the new links
+        db.session.expire(self, ["countries"])
 
     @classmethod
     def add_species(cls, species_id: int, user_id: int) -> None:
@@ -273,21 +569,379 @@ threatened={self.threatened}>'
             error_message = "You do not have that species in your list"
             raise SpeciesError(error_message)
 
+class CitySpeciesCount(db.Model):
+    """
+        Schema for number of users in each city that have each species in
+        their list. Has id of city, id of species, and number of users. Kept up
+        to date in the same transaction as any change to users' lists or
+        cities.
+    """
+
+    __tablename__ = "city_species_counts"
+
+    city_id = db.Column(
+        db.ForeignKey("cities.id", ondelete="cascade"),
+        primary_key=True
+    )
+
+    species_id = db.Column(
+        db.ForeignKey("species.id", ondelete="cascade"),
+        primary_key=True
+    )
+
+    num_of_users = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self) -> str:
+        """
+            Gets string representation of the count
+            :rtype: str
+        """
+
+        return f"<CitySpeciesCount city_id={self.city_id} \
+species_id={self.species_id} num_of_users={self.num_of_users}>"
+
+    @classmethod
+    def get_count(cls, city_id: int, species_id: int) -> int:
+        """
+            Gets number of users in city with id city_id that have species with
+            id species_id in their list
+            :type city_id: int
+            :type species_id: int
+            :rtype: int
+        """
+
+        count = cls.query.get((city_id, species_id))
+        if count:
+            return count.num_of_users
+        return 0
+
+    @classmethod
+    def change_counts(cls, session, changes: dict) -> None:
+        """
+            Adds delta to count for each (city_id, species_id): delta in
+            changes, in one statement. Doesn't commit.
+            :type changes: dict
+        """
+
+        values = [
+            { "city_id": city_id, "species_id": species_id, \
+                "num_of_users": delta } for ((city_id, species_id), delta) \
+                in changes.items() if delta
+        ]
+        if not values:
+            return
+        stmt = insert(cls).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.city_id, cls.species_id],
+            set_={
+                "num_of_users": \
+                    cls.num_of_users + stmt.excluded.num_of_users
+            }
+        )
+        session.execute(stmt)
+
+    @classmethod
+    def rebuild(cls) -> None:
+        """
+            Recounts every city and species from users' lists, for when counts
+            were never kept (e.g. existing db) or users were deleted in bulk
+        """
+
+        counts = db.session.query(
+            User.city_id,
+            User_Species.species_id,
+            db.func.count(User_Species.user_id)
+        ).join(
+            User,
+            User.id == User_Species.user_id
+        ).group_by(User.city_id, User_Species.species_id)
+        cls.query.delete()
+        db.session.execute(insert(cls).from_select(
+            ["city_id", "species_id", "num_of_users"],
+            counts
+        ))
+        db.session.commit()
+
+@event.listens_for(db.session, "before_flush")
+def find_city_species_changes(session, flush_context, instances) -> None:
+    """
+        Before users are written to db, finds how counts of users in each city
+        with each species will change
+    """
+
+    changes = []
+    for user in session.new:
+        if isinstance(user, User):
+            for species in user.species:
+                changes.append((user.city_id, species, 1))
+    for user in session.deleted:
+        if isinstance(user, User):
+            city_history = get_history(user, "city_id")
+            species_history = get_history(user, "species")
+            old_city_id = (city_history.deleted or city_history.unchanged)[0]
+            old_species = \
+                list(species_history.unchanged) + list(species_history.deleted)
+            for species in old_species:
+                changes.append((old_city_id, species, -1))
+    for user in session.dirty:
+        if not isinstance(user, User):
+            continue
+        # check without loading anything first, since most edits don't
+        # change lists or cities
+        attrs = inspect(user).attrs
+        if not attrs.city_id.history.has_changes() and \
+            not attrs.species.history.has_changes():
+            continue
+        city_history = get_history(user, "city_id")
+        species_history = get_history(user, "species")
+        new_city_id = user.city_id
+        if city_history.deleted or city_history.unchanged:
+            old_city_id = (city_history.deleted or city_history.unchanged)[0]
+        else:
+            # old city wasn't loaded before it was changed, but db still has it
+            old_city_id = session.query(User.city_id).filter(
+                User.id == user.id
+            ).scalar()
+        old_species = \
+            list(species_history.unchanged) + list(species_history.deleted)
+        new_species = \
+            list(species_history.unchanged) + list(species_history.added)
+        for species in old_species:
+            changes.append((old_city_id, species, -1))
+        for species in new_species:
+            changes.append((new_city_id, species, 1))
+    session.info["city_species_changes"] = changes
+
+@event.listens_for(db.session, "after_flush")
+def save_city_species_changes(session, flush_context) -> None:
+    """
+        After users are written to db, updates counts of users in each city
+        with each species in the same transaction
+    """
+
+    changes = {}
+    for (city_id, species, delta) in \
+        session.info.pop("city_species_changes", []):
+        # new species only have an id once they're written to db
+        key = (city_id, species.id)
+        changes[key] = changes.get(key, 0) + delta
+    CitySpeciesCount.change_counts(session, changes)
+
+class MissingSpecies(db.Model):
+    """
+        Schema for names of species the Red List API didn't know. Has the name
+        searched for and when the API was last asked about it.
+    """
+
+    __tablename__ = "missing_species"
+
+    name = db.Column(db.Text, primary_key=True)
+
+    checked_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+    def __repr__(self) -> str:
+        """
+            Gets string representation of the missing species
+            :rtype: str
+        """
+
+        return f'<MissingSpecies name="{self.name}" \
+checked_at={self.checked_at}>'
+
+    @classmethod
+    def is_missing(cls, species_name: str) -> bool:
+        """
+            Returns True if the API didn't know species with name species_name
+            within the last NEGATIVE_CACHE_TTL seconds, otherwise returns False
+            :type species_name: str
+            :rtype: bool
+        """
+
+        if missing_species_cache.get(species_name, False):
+            metrics.record_cache_lookup("missing_species", True)
+            return True
+        missing = cls.query.get(species_name)
+        if missing:
+            age = (datetime.utcnow() - missing.checked_at).total_seconds()
+            if age < NEGATIVE_CACHE_TTL:
+                # only keep in memory for as long as the row is still valid
+                missing_species_cache.set(
+                    species_name,
+                    True,
+                    ttl=NEGATIVE_CACHE_TTL - age
+                )
+                metrics.record_cache_lookup("missing_species", True)
+                return True
+        metrics.record_cache_lookup("missing_species", False)
+        return False
+
+    @classmethod
+    def remember(cls, species_name: str) -> None:
+        """
+            Records that the API doesn't know species with name species_name
+            :type species_name: str
+        """
+
+        now = datetime.utcnow()
+        stmt = insert(cls).values(name=species_name, checked_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.name],
+            set_={ "checked_at": now }
+        )
+        try:
+            db.session.execute(stmt)
+            db.session.commit()
+        except:
+            db.session.rollback()
+        missing_species_cache.set(species_name, True)
+
+class IUCNResponse(db.Model):
+    """
+        Schema for responses the Red List API gave about species, kept so that
+        species can still be found while the API is down. Has the path that
+        was called, the response as JSON, and when it was fetched.
+    """
+
+    __tablename__ = "iucn_responses"
+
+    path = db.Column(db.Text, primary_key=True)
+
+    body = db.Column(db.Text, nullable=False)
+
+    fetched_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+    def __repr__(self) -> str:
+        """
+            Gets string representation of the response
+            :rtype: str
+        """
+
+        return f'<IUCNResponse path="{self.path}" \
+fetched_at={self.fetched_at}>'
+
+    @classmethod
+    def store(cls, responses: Mapping[str, dict]) -> None:
+        """
+            Saves responses, which map path called to response, replacing
+            older responses for the same paths. Doesn't commit.
+            :type responses: Mapping[str, dict]
+        """
+
+        now = datetime.utcnow()
+        stmt = insert(cls).values([
+            { "path": path, "body": json.dumps(data), "fetched_at": now } for \
+                (path, data) in responses.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.path],
+            set_={
+                "body": stmt.excluded.body,
+                "fetched_at": stmt.excluded.fetched_at
+            }
+        )
+        db.session.execute(stmt)
+
+    @classmethod
+    def get_species_with_countries(cls, species_name: str, \
+        serve_stale: bool = True) -> Tuple[dict, dict, datetime]:
+        """
+            Gets data on species with name species_name and the countries it's
+            in from the API, along with when they were fetched. Responses for
+            species the API knows are saved. If the API fails and serve_stale
+            is True, gives the saved responses instead if there are any,
+            otherwise raises the API's IUCNError.
+            :type species_name: str
+            :type serve_stale: bool
+            :rtype: (dict, dict, datetime)
+        """
+
+        paths = (
+            iucn.species_path(species_name),
+            iucn.species_countries_path(species_name)
+        )
+        try:
+            # refreshes need what the API says now, not what was cached
+            data, countries_data = iucn.get_species_with_countries(
+                species_name,
+                fresh=not serve_stale
+            )
+        except iucn.IUCNError:
+            if not serve_stale:
+                raise
+            stored = { response.path: response for response in \
+                cls.query.filter(cls.path.in_(paths)).all() }
+            found = all(path in stored for path in paths)
+            metrics.record_cache_lookup("iucn_responses", found)
+            if not found:
+                raise
+            (data, countries_data) = \
+                [json.loads(stored[path].body) for path in paths]
+            fetched_at = min(stored[path].fetched_at for path in paths)
+            return data, countries_data, fetched_at
+        # only species the API knows are worth keeping
+        if data.get("result"):
+            cls.store(dict(zip(paths, (data, countries_data))))
+        return data, countries_data, datetime.utcnow()
+
+def normalize_city_name(city_name: str) -> str:
+    """
+        Gets form of city_name used to tell if two cities are the same,
+        ignoring case and extra spaces
+        :type city_name: str
+        :rtype: str
+    """
+
+    return " ".join(city_name.split()).lower()
+
+def default_normalized_name(context) -> str:
+    """
+        Gets normalized name of city being inserted, so it doesn't need to be
+        given when creating a city
+        :rtype: str
+    """
+
+    return normalize_city_name(context.get_current_parameters()["name"])
+
 class City(db.Model):
     """
-        Schema for cities. Has city's id, name, and id of the country it's in.
+        Schema for cities. Has city's id, name, its normalized name, and id of
+        the country it's in. Each country has only one city with the same
+        normalized name.
     """
 
     __tablename__ = "cities"
 
+    __table_args__ = (
+        db.UniqueConstraint(
+            "country_id",
+            "normalized_name",
+            name="uq_cities_country_id_normalized_name"
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
 
-    name = db.Column(db.Text, nullable=False)
+    name = db.Column(db.Text, nullable=False, index=True)
+
+    normalized_name = db.Column(
+        db.Text,
+        nullable=False,
+        default=default_normalized_name
+    )
 
     country_id = db.Column(
         db.Integer,
         db.ForeignKey("countries.id"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     users = db.relationship("User", backref="city")
@@ -301,6 +955,55 @@ class City(db.Model):
         return f"<City id={self.id} name={self.name} \
 country_id={self.country_id}>"
 
+    @classmethod
+    def resolve(cls, city_name: str, country_code: str) -> int:
+        """
+            Gets id of city with name city_name in country with code
+            country_code, adding the city to db if it isn't there yet. New
+            cities are added with one upsert, so users signing up from the
+            same new city at the same time get the same city. Doesn't commit.
+            :type city_name: str
+            :type country_code: str
+            :rtype: int
+        """
+
+        country_id = Country.get_ids([country_code]).get(country_code, None)
+        if country_id is None:
+            raise CountryError("Could not find country")
+        normalized_name = normalize_city_name(city_name)
+        # most cities are already in db, and reading them doesn't lock the
+        # city row until the user is saved like the upsert would
+        city_id = db.session.query(cls.id).filter(
+            cls.country_id == country_id,
+            cls.normalized_name == normalized_name
+        ).scalar()
+        if city_id is not None:
+            return city_id
+
+        stmt = insert(cls).values(
+            name=city_name,
+            normalized_name=normalized_name,
+            country_id=country_id
+        )
+        # updating the city to itself lets RETURNING give id of existing city
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.country_id, cls.normalized_name],
+            set_={ "normalized_name": stmt.excluded.normalized_name }
+        ).returning(cls.id)
+        return db.session.execute(stmt).scalar()
+
+class CountryRegistry(NamedTuple):
+    """
+        Read-only snapshot of all countries. Has ids of countries by code,
+        names of countries by id, and (code, name) choices for forms.
+    """
+
+    ids: Mapping[str, int]
+
+    names: Mapping[int, str]
+
+    choices: Tuple[Tuple[str, str], ...]
+
 class Country(db.Model):
     """
         Schema for countries. Has country's id and name.
@@ -324,29 +1027,177 @@ class Country(db.Model):
 
         return f"<Country id={self.id} name={self.name} code={self.code}>"
 
+    @classmethod
+    def registry(cls) -> CountryRegistry:
+        """
+            Gets registry of all countries, only loading it from db the first
+            time it's needed in this process
+            :rtype: CountryRegistry
+        """
+
+        global _country_registry
+
+        registry = _country_registry
+        metrics.record_cache_lookup("country_registry", registry is not None)
+        if registry is None:
+            rows = db.session.query(cls.id, cls.code, cls.name).order_by(
+                cls.id
+            ).all()
+            registry = CountryRegistry(
+                ids=MappingProxyType({ code: id for (id, code, name) in rows }),
+                names=MappingProxyType(
+                    { id: name for (id, code, name) in rows }
+                ),
+                choices=tuple((code, name) for (id, code, name) in rows)
+            )
+            # countries might still be loaded later, possibly by another worker
+            if rows:
+                _country_registry = registry
+        return registry
+
+    @classmethod
+    def get_ids(cls, codes: list) -> dict:
+        """
+            Gets ids of countries with codes in codes by code, from the
+            registry. Only countries added since the registry was loaded are
+            looked up in db. Codes of countries not in db are left out.
+            :type codes: list
+            :rtype: dict
+        """
+
+        ids = cls.registry().ids
+        found = { code: ids[code] for code in codes if code in ids }
+        missing = [code for code in codes if code not in ids]
+        if missing:
+            found.update(db.session.query(cls.code, cls.id).filter(
+                cls.code.in_(missing)
+            ).all())
+        return found
+
+    @classmethod
+    def get_name(cls, country_id: int) -> str:
+        """
+            Gets name of country with id country_id from the registry, or from
+            db if it was added since the registry was loaded
+            :type country_id: int
+            :rtype: str
+        """
+
+        name = cls.registry().names.get(country_id, None)
+        if name is None:
+            name = db.session.query(cls.name).filter(
+                cls.id == country_id
+            ).scalar()
+        return name
+
+    @classmethod
+    def invalidate_registry(cls) -> None:
+        """
+            Makes next call to registry load countries from db again
+        """
+
+        global _country_registry
+
+        _country_registry = None
+
+    @classmethod
+    def load_countries(cls, results: list) -> None:
+        """
+            Adds countries in results, formatted like the Red List API's
+            country list, to db in one statement. Countries already in db are
+            skipped.
+            :type results: list
+        """
+
+        if results:
+            stmt = insert(cls).values([
+                { "name": result["country"], "code": result["isocode"] } \
+                    for result in results
+            ]).on_conflict_do_nothing()
+            db.session.execute(stmt)
+        db.session.commit()
+        cls.invalidate_registry()
+
     @classmethod
     def get_countries(cls):
         """
             Gets all countries from Red List API
         """
 
-        params = { "token": TOKEN }
         try:
-            resp = requests.get(f"{BASE_URL}country/list", params=params)
-            data = resp.json()
-            results = data["results"]
-            for result in results:
-                country = Country(
-                    name=result["country"],
-                    code=result["isocode"]
-                )
-                db.session.add(country)
-            db.session.commit()
+            data = iucn.get_countries()
+            cls.load_countries(data["results"])
+        except:
+            db.session.rollback()
+            error_message = "Could not load countries"
+            raise CountryError(error_message)
+
+    @classmethod
+    def load_snapshot(cls, path: str = COUNTRY_SNAPSHOT) -> None:
+        """
+            Gets all countries from snapshot of Red List API's country list at
+            path, without needing to call the API
+            :type path: str
+        """
+
+        try:
+            with open(path, encoding="utf-8") as snapshot:
+                data = json.load(snapshot)
+            cls.load_countries(data["results"])
         except:
             db.session.rollback()
             error_message = "Could not load countries"
             raise CountryError(error_message)
 
+class Notification(db.Model):
+    """
+        Schema for emails waiting to be sent, or that have been sent. Has
+        notification's id, the recipient's email address, subject, body, when
+        it was queued and sent, how many times sending it was tried, and when
+        it may be tried next.
+    """
+
+    __tablename__ = "notifications"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+
+    recipient = db.Column(db.Text, nullable=False)
+
+    subject = db.Column(
+        db.Text,
+        nullable=False,
+        default=NOTIFICATION_SUBJECT
+    )
+
+    body = db.Column(db.Text, nullable=False)
+
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+    sent_at = db.Column(db.DateTime)
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    next_attempt_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+    last_error = db.Column(db.Text)
+
+    def __repr__(self) -> str:
+        """
+            Gets string representation of the notification
+            :rtype: str
+        """
+
+        return f"<Notification id={self.id} recipient={self.recipient} \
+sent_at={self.sent_at} attempts={self.attempts}>"
+
 class User_Species(db.Model):
     """
         Schema to connect users to species
@@ -361,7 +1212,8 @@ class User_Species(db.Model):
 
     species_id = db.Column(
         db.ForeignKey("species.id", ondelete="cascade"),
-        primary_key=True
+        primary_key=True,
+        index=True
     )
 
     def __repr__(self) -> str:
@@ -388,7 +1240,8 @@ class Species_Country(db.Model):
 
     country_id = db.Column(
         db.ForeignKey("countries.id", ondelete="cascade"),
-        primary_key=True
+        primary_key=True,
+        index=True
     )
 
     def __repr__(self) -> str:
@@ -0,0 +1,105 @@
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+import multiprocessing
+import os
+
+# "inline" hashes passwords in the process handling the request, "process"
+# hands them to a pool of processes so hashing can't starve other requests.
+# Every gunicorn worker gets its own pool, so the pool is kept small: with
+# workers x processes hashing at once past the number of CPUs, logins just
+# queue for the CPU and each pool process still costs its own memory. One
+# process per worker takes hashing off the worker's threads; a second lets a
+# worker hash two passwords at once on hosts with CPUs to spare.
+HASHING_MODE = os.environ.get("PASSWORD_HASHING_MODE", "inline")
+HASHING_PROCESSES = int(os.environ.get("PASSWORD_HASHING_PROCESSES", 1))
+# passwords hashed with a different number of rounds are rehashed on login
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+
+_executor = None
+_executor_pid = None
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+        Gets pool of processes used to hash passwords from this process
+        :rtype: ProcessPoolExecutor
+    """
+
+    global _executor, _executor_pid
+
+    if _executor is None or _executor_pid != os.getpid():
+        # new processes are started fresh rather than copying a worker that
+        # may be in the middle of using threads
+        _executor = ProcessPoolExecutor(
+            max_workers=HASHING_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        _executor_pid = os.getpid()
+    return _executor
+
+def hash_with_rounds(password: str, rounds: int) -> str:
+    """
+        Hashes password with bcrypt using rounds rounds
+        :type password: str
+        :type rounds: int
+        :rtype: str
+    """
+
+    hashed_password = bcrypt.hashpw(
+        password.encode("utf8"),
+        bcrypt.gensalt(rounds)
+    )
+    return hashed_password.decode("utf8")
+
+def matches(hashed_password: str, password: str) -> bool:
+    """
+        Returns True if password hashes to hashed_password, otherwise False
+        :type hashed_password: str
+        :type password: str
+        :rtype: bool
+    """
+
+    return bcrypt.checkpw(
+        password.encode("utf8"),
+        hashed_password.encode("utf8")
+    )
+
+def run(func, *args):
+    """
+        Calls func with args, in pool of processes if HASHING_MODE is "process"
+        :type func: function
+        :rtype: Any
+    """
+
+    if HASHING_MODE == "process":
+        return get_executor().submit(func, *args).result()
+    return func(*args)
+
+def hash_password(password: str) -> str:
+    """
+        Hashes password with BCRYPT_ROUNDS rounds
+        :type password: str
+        :rtype: str
+    """
+
+    return run(hash_with_rounds, password, BCRYPT_ROUNDS)
+
+def check_password(hashed_password: str, password: str) -> bool:
+    """
+        Returns True if password hashes to hashed_password, otherwise False
+        :type hashed_password: str
+        :type password: str
+        :rtype: bool
+    """
+
+    return run(matches, hashed_password, password)
+
+def needs_rehash(hashed_password: str) -> bool:
+    """
+        Returns True if hashed_password wasn't hashed with BCRYPT_ROUNDS rounds
+        :type hashed_password: str
+        :rtype: bool
+    """
+
+    # bcrypt hashes look like $2b$<rounds>$<salt and hash>
+    rounds = int(hashed_password.split("$")[2])
+    return rounds != BCRYPT_ROUNDS
@@ -0,0 +1,192 @@
+from cache import SQLiteConnections
+from collections import deque
+from threading import Lock
+import sqlite3
+import time
+
+class TokenBucket:
+    """
+        Rate limiter shared by every process on the host, which lets through
+        rate calls a second on average and up to burst calls at once. Tokens
+        are kept in a SQLite file, so gunicorn workers draw from the same
+        bucket.
+    """
+
+    def __init__(self, path: str, name: str, rate: float, \
+        burst: float) -> None:
+        """
+            Constructor for TokenBucket
+            :type path: str
+            :type name: str
+            :type rate: float
+            :type burst: float
+        """
+
+        self.path = path
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.connections = SQLiteConnections(path, [
+            "CREATE TABLE IF NOT EXISTS buckets "
+            "(name TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        ])
+
+    def connect(self) -> sqlite3.Connection:
+        """
+            Gets this thread's connection to the bucket's file, creating its
+            table the first time in each process
+            :rtype: sqlite3.Connection
+        """
+
+        return self.connections.get()
+
+    def take(self) -> float:
+        """
+            Takes a token if there is one and returns 0, otherwise returns
+            seconds until there will be one
+            :rtype: float
+        """
+
+        conn = self.connect()
+        try:
+            # lock the file so no other process takes the same token
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE name = ?",
+                (self.name,)
+            ).fetchone()
+            # wall clock, since it's the same in every process
+            now = time.time()
+            if row is None:
+                tokens = self.burst
+            else:
+                (tokens, updated_at) = row
+                elapsed = max(now - updated_at, 0)
+                tokens = min(tokens + elapsed * self.rate, self.burst)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) "
+                "VALUES (?, ?, ?)",
+                (self.name, tokens, now)
+            )
+            conn.execute("COMMIT")
+            return wait
+        except BaseException:
+            self.connections.rollback(conn)
+            raise
+
+    def acquire(self, timeout: float) -> bool:
+        """
+            Takes a token, waiting up to timeout seconds for one. Returns
+            False if there wasn't one in time.
+            :type timeout: float
+            :rtype: bool
+        """
+
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.take()
+            if not wait:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+class CircuitBreaker:
+    """
+        Stops calls to a service once too many of the latest calls to it have
+        failed, so callers fail fast instead of waiting on it. After
+        reset_timeout seconds one trial call is let through, and calls go back
+        to normal if it succeeds. Each process has its own breaker.
+    """
+
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+    def __init__(self, failure_threshold: float, window: int, \
+        min_calls: int, reset_timeout: float) -> None:
+        """
+            Constructor for CircuitBreaker. Opens once at least min_calls of
+            the latest window calls were made and failure_threshold of them
+            failed.
+            :type failure_threshold: float
+            :type window: int
+            :type min_calls: int
+            :type reset_timeout: float
+        """
+
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0
+        self._trial_running = False
+        self._lock = Lock()
+
+    def allow(self) -> bool:
+        """
+            Checks if a call may be made now
+            :rtype: bool
+        """
+
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+            # only one trial call at a time while half open
+            if self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record(self, success: bool) -> None:
+        """
+            Records whether a call that was allowed succeeded
+            :type success: bool
+        """
+
+        with self._lock:
+            # calls made before breaker opened don't change anything
+            if self.state == self.OPEN:
+                return
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+                if success:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and \
+                failures / len(self._outcomes) >= self.failure_threshold:
+                self._open()
+
+    def cancel(self) -> None:
+        """
+            Records that a call that was allowed wasn't made after all
+        """
+
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+
+    def _open(self) -> None:
+        """
+            Stops calls until reset_timeout seconds from now
+        """
+
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
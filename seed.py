@@ -1,9 +1,16 @@
 from models import db, User, Species, City, Country, User_Species, \
     Species_Country
 from app import app
+from flask_migrate import stamp
 
 db.drop_all()
 db.create_all()
+# tables are already up to date, so later migrations start from here
+with app.app_context():
+    stamp()
+
+# countries are needed for anyone to sign up
+Country.load_snapshot()
 
 # commented out for deployment
 # # add sample countries
@@ -0,0 +1,33 @@
+from unittest import TestCase
+from bench.run import percentile, summarize, compare
+
+class BenchTestCase(TestCase):
+    """
+        Tests for reporting of load test results
+    """
+
+    def test_percentile(self) -> None:
+        """
+            Tests percentiles use nearest rank
+        """
+
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([5], 99), 5)
+        self.assertEqual(percentile([], 50), 0)
+
+    def test_compare(self) -> None:
+        """
+            Tests only routes whose p95 got slower than threshold are reported
+        """
+
+        baseline = summarize([("home", 10, True), ("search", 100, True)], 1)
+        results = summarize([("home", 11, True), ("search", 150, False)], 1)
+
+        self.assertEqual(results["routes"]["search"]["errors"], 1)
+        regressions = compare(results, baseline, 0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn("search", regressions[0])
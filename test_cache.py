@@ -0,0 +1,205 @@
+from unittest import TestCase
+from unittest.mock import patch
+from threading import Event, Thread
+from cache import DiskCache, SingleFlight, TTLCache
+import os
+import tempfile
+import time
+
+class TTLCacheTestCase(TestCase):
+    """
+        Tests for in-process TTLCache
+    """
+
+    def test_ttl(self) -> None:
+        """
+            Tests entries are forgotten once they expire
+        """
+
+        cache = TTLCache(maxsize=10, ttl=60)
+        with patch("cache.time.monotonic", return_value=100):
+            cache.set("key", "value")
+            cache.set("short", "value", ttl=1)
+            self.assertEqual(cache.get("key"), "value")
+            self.assertEqual(cache.get("short"), "value")
+
+        with patch("cache.time.monotonic", return_value=130):
+            self.assertEqual(cache.get("key"), "value")
+            self.assertIsNone(cache.get("short"))
+
+        with patch("cache.time.monotonic", return_value=160):
+            self.assertEqual(cache.get("key", "default"), "default")
+
+    def test_maxsize(self) -> None:
+        """
+            Tests least recently used entry is dropped when cache is full
+        """
+
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # use "a" so that "b" is the least recently used
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+        cache.delete("a")
+        self.assertIsNone(cache.get("a"))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+class DiskCacheTestCase(TestCase):
+    """
+        Tests for DiskCache shared by worker processes
+    """
+
+    def setUp(self) -> None:
+        """
+            Makes a file for the cache
+        """
+
+        (fd, self.path) = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+
+    def tearDown(self) -> None:
+        """
+            Removes cache's file, along with files SQLite keeps next to it
+        """
+
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_ttl(self) -> None:
+        """
+            Tests entries are shared through the file, and forgotten once they
+            expire
+        """
+
+        cache = DiskCache(self.path, ttl=60, max_bytes=1024)
+        with patch("cache.time.time", return_value=100):
+            cache.set("key", "value")
+            cache.set("short", "value", ttl=1)
+            # another process using the same file sees the same entries
+            other_cache = DiskCache(self.path, ttl=60, max_bytes=1024)
+            self.assertEqual(other_cache.get("key"), "value")
+            self.assertEqual(other_cache.get("short"), "value")
+
+        with patch("cache.time.time", return_value=130):
+            self.assertEqual(cache.get("key"), "value")
+            self.assertIsNone(cache.get("short"))
+
+        with patch("cache.time.time", return_value=160):
+            self.assertEqual(cache.get("key", "default"), "default")
+
+    def test_max_bytes(self) -> None:
+        """
+            Tests entries closest to expiring are dropped once the cache is
+            too big
+        """
+
+        cache = DiskCache(self.path, ttl=60, max_bytes=10)
+        with patch("cache.time.time", return_value=100):
+            cache.set("a", "12345", ttl=10)
+            cache.set("b", "1234", ttl=20)
+            self.assertEqual(len(cache), 2)
+            cache.set("c", "123", ttl=30)
+
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("b"), "1234")
+            self.assertEqual(cache.get("c"), "123")
+
+        cache.delete("b")
+        self.assertIsNone(cache.get("b"))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_connections(self) -> None:
+        """
+            Tests each thread keeps using its own connection, and the table is
+            only created once
+        """
+
+        cache = DiskCache(self.path, ttl=60, max_bytes=1024)
+        conn = cache.connect()
+        self.assertIs(cache.connect(), conn)
+        conn.execute("DROP TABLE entries")
+        # table isn't created again when another thread connects
+        other_conns = []
+        thread = Thread(target=lambda: other_conns.append(cache.connect()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other_conns[0], conn)
+        self.assertEqual(
+            conn.execute(
+                "SELECT count(*) FROM sqlite_master WHERE name = 'entries'"
+            ).fetchone()[0],
+            0
+        )
+
+        # test failed write is undone, and connection can be used again
+        cache = DiskCache(self.path, ttl=60, max_bytes=None)
+        with self.assertRaises(TypeError):
+            cache.set("key", "value")
+        self.assertFalse(cache.connect().in_transaction)
+        self.assertIsNone(cache.get("key"))
+
+class SingleFlightTestCase(TestCase):
+    """
+        Tests for SingleFlight
+    """
+
+    def test_do(self) -> None:
+        """
+            Tests callers asking for the same key at the same time share one
+            call and its result
+        """
+
+        single_flight = SingleFlight()
+        entered = Event()
+        release = Event()
+        calls = []
+        def fetch(name: str) -> str:
+            calls.append(name)
+            entered.set()
+            release.wait(5)
+            return name.upper()
+
+        results = []
+        def caller() -> None:
+            results.append(single_flight.do("key", fetch, "species"))
+        threads = [Thread(target=caller) for i in range(5)]
+        threads[0].start()
+        entered.wait(5)
+        # other callers arrive while first call is still running
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls, ["species"])
+        self.assertEqual(results, ["SPECIES"] * len(threads))
+        self.assertEqual(len(single_flight), 0)
+
+        # next call for the key isn't shared with the finished one
+        self.assertEqual(single_flight.do("key", fetch, "other"), "OTHER")
+
+    def test_do_error(self) -> None:
+        """
+            Tests callers get the exception raised by the shared call
+        """
+
+        single_flight = SingleFlight()
+        def fail() -> None:
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            single_flight.do("key", fail)
+        self.assertEqual(len(single_flight), 0)
@@ -24,6 +24,7 @@ class CountryModelTestCase(TestCase):
         Species.query.delete()
         City.query.delete()
         Country.query.delete()
+        Country.invalidate_registry()
 
         self.country1 = { "name": "Country 1", "code": "C1" }
         self.country2 = { "name": "Country 2", "code": "C2" }
@@ -118,6 +119,73 @@ code={country.code}>"
             db.session.commit()
         db.session.rollback()
 
+    def test_registry(self) -> None:
+        """
+            Tests registry has all countries and is reloaded once invalidated
+        """
+
+        country1 = Country(name=self.country1["name"], code=self.country1["code"])
+        db.session.add(country1)
+        db.session.commit()
+        Country.invalidate_registry()
+
+        registry = Country.registry()
+        self.assertEqual(registry.ids[country1.code], country1.id)
+        self.assertEqual(registry.names[country1.id], country1.name)
+        self.assertEqual(registry.choices, ((country1.code, country1.name),))
+        # test registry isn't loaded again until invalidated
+        self.assertIs(Country.registry(), registry)
+
+        country2 = Country(name=self.country2["name"], code=self.country2["code"])
+        db.session.add(country2)
+        db.session.commit()
+        Country.invalidate_registry()
+
+        registry = Country.registry()
+        self.assertEqual(len(registry.choices), 2)
+        self.assertEqual(registry.ids[country2.code], country2.id)
+
+    def test_get_ids(self) -> None:
+        """
+            Tests ids come from registry, and countries added after it was
+            loaded are still found
+        """
+
+        country1 = Country(name=self.country1["name"], code=self.country1["code"])
+        db.session.add(country1)
+        db.session.commit()
+        Country.invalidate_registry()
+        Country.registry()
+
+        country2 = Country(name=self.country2["name"], code=self.country2["code"])
+        db.session.add(country2)
+        db.session.commit()
+
+        ids = Country.get_ids([country1.code, country2.code, "ZZ"])
+        self.assertEqual(ids, {
+            country1.code: country1.id,
+            country2.code: country2.id
+        })
+
+    def test_get_name(self) -> None:
+        """
+            Tests names come from registry, and countries added after it was
+            loaded are still found
+        """
+
+        country1 = Country(name=self.country1["name"], code=self.country1["code"])
+        db.session.add(country1)
+        db.session.commit()
+        Country.invalidate_registry()
+        Country.registry()
+
+        country2 = Country(name=self.country2["name"], code=self.country2["code"])
+        db.session.add(country2)
+        db.session.commit()
+
+        self.assertEqual(Country.get_name(country1.id), country1.name)
+        self.assertEqual(Country.get_name(country2.id), country2.name)
+
     def test_get_countries(self) -> None:
         """
             Tests can get countries from external API
@@ -135,4 +203,20 @@ code={country.code}>"
         self.assertEqual(
             gb.name,
             "United Kingdom of Great Britain and Northern Ireland"
-        )
\ No newline at end of file
+        )
+
+    def test_load_snapshot(self) -> None:
+        """
+            Tests can get countries from snapshot without calling external API,
+            and loading them again doesn't add duplicates
+        """
+
+        Country.load_snapshot()
+        num_of_countries = Country.query.count()
+        Country.load_snapshot()
+
+        self.assertEqual(Country.query.count(), num_of_countries)
+        us = Country.query.filter_by(code="US").one_or_none()
+        self.assertIsNotNone(us)
+        self.assertEqual(us.name, "United States of America")
+        self.assertEqual(len(Country.registry().choices), num_of_countries)
@@ -1,7 +1,11 @@
 from unittest import TestCase
+from unittest.mock import patch
+from contextlib import contextmanager
 from models import db, User, Species, City, Country, TOKEN, BASE_URL
 from app import app, create_user, is_match, make_notification
+from sqlalchemy import event
 from sqlalchemy.exc import IntegrityError
+import iucn
 
 app.config["TESTING"] = True
 app.config["DEBUG_TB_HOST"] = ["dont-show-debug-toolbar"]
@@ -10,6 +14,27 @@ app.config["WTF_CSRF_ENABLED"] = False
 
 db.create_all()
 
+# most queries each page may make, no matter how much data the user has
+QUERY_BUDGETS = {
+    "/home": 3,
+    "/edit": 2
+}
+
+@contextmanager
+def count_queries():
+    """
+        Counts queries sent to db inside with block
+    """
+
+    queries = []
+    def count_query(conn, cursor, statement, parameters, context, many):
+        queries.append(statement)
+    event.listen(db.engine, "before_cursor_execute", count_query)
+    try:
+        yield queries
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_query)
+
 class FlaskTestCase(TestCase):
     """
         Tests helper functions in app.py
@@ -24,6 +49,7 @@ class FlaskTestCase(TestCase):
         Species.query.delete()
         City.query.delete()
         Country.query.delete()
+        Country.invalidate_registry()
 
         self.localhost = "http://localhost/"
 
@@ -88,7 +114,7 @@ class FlaskTestCase(TestCase):
         self.city = "City1"
 
         # add countries to db
-        Country.get_countries()
+        Country.load_snapshot()
         country = Country.query.filter_by(code="US").one()
         self.country_id = country.id
 
@@ -137,6 +163,109 @@ class FlaskTestCase(TestCase):
             self.assertIn(species_name, html)
             self.assertIn(species_threatened, html)
 
+    def test_query_budgets(self) -> None:
+        """
+            Tests pages stay within their query budget even when user has many
+            species in their list
+        """
+
+        city = City(name=self.city, country_id=self.country_id)
+        db.session.add(city)
+        db.session.commit()
+        user = User(
+            username=self.users[0]["username"],
+            email=self.users[0]["email"],
+            password=self.users[0]["password"],
+            city_id=city.id
+        )
+        db.session.add(user)
+        num_of_species = 50
+        for i in range(num_of_species):
+            user.species.append(Species(name=f"species{i}", threatened="VU"))
+        searched_species = Species(name="searched species", threatened="EN")
+        db.session.add(searched_species)
+        db.session.commit()
+        user_id = user.id
+        searched_species_id = searched_species.id
+        # make pages load everything from db
+        db.session.remove()
+
+        with self.client as c:
+            with c.session_transaction() as change_session:
+                change_session["current_user_id"] = user_id
+            # warm up country registry so it isn't counted
+            c.get("/edit")
+            for (url, budget) in QUERY_BUDGETS.items():
+                db.session.remove()
+                with count_queries() as queries:
+                    resp = c.get(url)
+                self.assertEqual(resp.status_code, 200)
+                self.assertLessEqual(len(queries), budget, url)
+
+            # test searched species doesn't push home page over its budget
+            with c.session_transaction() as change_session:
+                change_session["species_id"] = searched_species_id
+            db.session.remove()
+            with count_queries() as queries:
+                resp = c.get("/home")
+            html = resp.get_data(as_text=True)
+            self.assertIn("searched species", html)
+            self.assertIn("species49", html)
+            self.assertLessEqual(len(queries), QUERY_BUDGETS["/home"])
+
+    def test_server_timing(self) -> None:
+        """
+            Tests responses report number of queries and time taken
+        """
+
+        with self.client as c:
+            with count_queries() as queries:
+                resp = c.get("/signup")
+            self.assertEqual(resp.status_code, 200)
+            server_timing = resp.headers["Server-Timing"]
+            self.assertIn(f'db;desc="{len(queries)} queries"', server_timing)
+            self.assertIn("app;dur=", server_timing)
+
+    def test_show_metrics(self) -> None:
+        """
+            Tests metrics page has latency of requests in Prometheus format
+        """
+
+        with self.client as c:
+            c.get("/login")
+            resp = c.get("/metrics")
+            text = resp.get_data(as_text=True)
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn("text/plain", resp.headers["Content-Type"])
+            self.assertIn("http_request_duration_seconds_bucket", text)
+            self.assertIn('endpoint="login_form"', text)
+
+            # test other hosts can't see metrics
+            resp = c.get(
+                "/metrics",
+                environ_base={ "REMOTE_ADDR": "203.0.113.1" }
+            )
+            self.assertEqual(resp.status_code, 403)
+
+    def test_show_metrics_token(self) -> None:
+        """
+            Tests metrics page needs token once one is set
+        """
+
+        with patch("metrics.METRICS_TOKEN", "token"), self.client as c:
+            resp = c.get("/metrics")
+            self.assertEqual(resp.status_code, 403)
+            resp = c.get(
+                "/metrics",
+                headers={ "Authorization": "Bearer wrong" }
+            )
+            self.assertEqual(resp.status_code, 403)
+            resp = c.get(
+                "/metrics",
+                headers={ "Authorization": "Bearer token" }
+            )
+            self.assertEqual(resp.status_code, 200)
+
     def test_get_species_data(self) -> None:
         """
             Tests can get species data only if logged in
@@ -193,6 +322,76 @@ class FlaskTestCase(TestCase):
             # verify other species not on page anymore
             self.assertNotIn(species_in_us, html)
 
+    def test_get_species_json(self) -> None:
+        """
+            Tests species API answers with JSON only if logged in, and with 304
+            if client already has the data
+        """
+
+        with self.client as c:
+            # verify can't get species data if not logged in
+            params = { "name": self.species["name"] }
+            resp = c.get("/api/species", query_string=params)
+            self.assertEqual(resp.status_code, 401)
+            self.assertIn("error", resp.get_json())
+
+            city = City(name=self.city, country_id=self.country_id)
+            db.session.add(city)
+            db.session.commit()
+            user = User(
+                username=self.users[0]["username"],
+                email=self.users[0]["email"],
+                password=self.users[0]["password"],
+                city_id=city.id
+            )
+            species = Species(
+                name=self.species["name"],
+                threatened=self.species["threatened"]
+            )
+            species.countries.append(Country.query.get(self.country_id))
+            db.session.add_all([user, species])
+            db.session.commit()
+            user_id = user.id
+            with c.session_transaction() as change_session:
+                change_session["current_user_id"] = user_id
+
+            # verify can get species data if logged in
+            resp = c.get("/api/species", query_string=params)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.get_json(), {
+                "name": self.species["name"],
+                "category": self.species["threatened"],
+                "countries": ["US"],
+                "in_my_country": True
+            })
+            self.assertIn("private", resp.headers["Cache-Control"])
+            self.assertIn("Cookie", resp.headers["Vary"])
+            etag = resp.headers["ETag"]
+
+            # verify unchanged data isn't sent again
+            resp = c.get(
+                "/api/species",
+                query_string=params,
+                headers={ "If-None-Match": etag }
+            )
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.get_data(), b"")
+
+            # verify missing name is an error
+            resp = c.get("/api/species")
+            self.assertEqual(resp.status_code, 400)
+
+            # verify API being down isn't reported as species not existing
+            error = iucn.IUCNUnavailable("The Red List API is down right now.")
+            with patch("iucn.get_species_with_countries", side_effect=error):
+                resp = c.get("/api/species", query_string={
+                    "name": "canis lupus"
+                })
+            self.assertEqual(resp.status_code, 503)
+            self.assertIn("error", resp.get_json())
+            self.assertIn("Retry-After", resp.headers)
+            self.assertIn("no-store", resp.headers["Cache-Control"])
+
     # def test_add_species_to_list(self) -> None:
     #     """
     #         Test can add species to list only if not already on list, and get
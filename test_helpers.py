@@ -1,6 +1,8 @@
 from unittest import TestCase
-from models import db, User, Species, City, Country, TOKEN, BASE_URL
-from app import app, create_user, edit_profile, is_match, make_notification
+from models import db, User, Species, City, Country, CitySpeciesCount, \
+    Notification, TOKEN, BASE_URL
+from app import app, create_user, edit_profile, is_match, make_notification, \
+    queue_notifications
 from sqlalchemy.exc import IntegrityError
 
 app.config["TESTING"] = True
@@ -23,6 +25,8 @@ class HelpersTestCase(TestCase):
         Species.query.delete()
         City.query.delete()
         Country.query.delete()
+        Country.invalidate_registry()
+        Notification.query.delete()
 
         self.users = [
             {
@@ -176,6 +180,49 @@ class HelpersTestCase(TestCase):
         )
         self.assertIsNone(user)
 
+    def test_create_user_city(self) -> None:
+        """
+            Tests users in cities with the same name are only put in the same
+            city if it's in the same country
+        """
+
+        user1 = self.users[0]
+        user2 = self.users[1]
+        user3 = self.users[2]
+        city_name = self.cities[0]
+        country1_code = self.countries[0].code
+        country2_code = self.countries[1].code
+
+        user1 = create_user(
+            user1["username"],
+            user1["email"],
+            user1["password"],
+            city_name,
+            country1_code
+        )
+        # same city name, different country
+        user2 = create_user(
+            user2["username"],
+            user2["email"],
+            user2["password"],
+            city_name,
+            country2_code
+        )
+        # same city and country, typed differently
+        user3 = create_user(
+            user3["username"],
+            user3["email"],
+            user3["password"],
+            f"  {city_name.upper()} ",
+            country1_code
+        )
+
+        self.assertNotEqual(user1.city_id, user2.city_id)
+        self.assertEqual(user1.city_id, user3.city_id)
+        self.assertEqual(user1.city.name, city_name)
+        self.assertEqual(user2.city.country.code, country2_code)
+        self.assertEqual(City.query.count(), 2)
+
     def test_edit_profile(self) -> None:
         """
             Tests edits profile correctly
@@ -253,6 +300,57 @@ class HelpersTestCase(TestCase):
         self.assertEqual(user.city.name, city2_name)
         self.assertEqual(user.city.country.code, country2_code)
 
+    def test_edit_profile_taken(self) -> None:
+        """
+            Tests nothing is changed if edited username is already taken
+        """
+
+        city1_name = self.cities[0]
+        city2_name = self.cities[1]
+        country_code = self.countries[0].code
+        user1 = create_user(
+            self.users[0]["username"],
+            self.users[0]["email"],
+            self.users[0]["password"],
+            city1_name,
+            country_code
+        )
+        user2 = create_user(
+            self.users[1]["username"],
+            self.users[1]["email"],
+            self.users[1]["password"],
+            city1_name,
+            country_code
+        )
+        user_id = user1.id
+
+        edited = edit_profile(
+            user_id,
+            user2.username,
+            self.users[2]["email"],
+            city2_name,
+            country_code
+        )
+        self.assertFalse(edited)
+
+        user = User.query.get(user_id)
+        self.assertEqual(user.username, self.users[0]["username"])
+        self.assertEqual(user.email, self.users[0]["email"])
+        self.assertEqual(user.city.name, city1_name)
+        # new city isn't left behind either
+        self.assertIsNone(City.query.filter_by(name=city2_name).one_or_none())
+
+        # edit goes through once username is free
+        edited = edit_profile(
+            user_id,
+            self.users[2]["username"],
+            self.users[2]["email"],
+            city2_name,
+            country_code
+        )
+        self.assertTrue(edited)
+        self.assertEqual(user.city.name, city2_name)
+
     def test_is_match(self) -> None:
         """
             Tests is_match(species_id) returns true only if species with id
@@ -335,6 +433,65 @@ class HelpersTestCase(TestCase):
 
         self.assertFalse(is_match(species_id, city_id1))
 
+    def test_city_species_count(self) -> None:
+        """
+            Tests number of users in a city with a species is kept up to date
+            when users add or remove the species, change city, or are deleted
+        """
+
+        species = Species(
+            name=self.species["name"],
+            threatened=self.species["threatened"]
+        )
+        db.session.add(species)
+        db.session.commit()
+        species_id = species.id
+
+        country = self.countries[0]
+        city1 = City(name=self.cities[0], country_id=country.id)
+        db.session.add(city1)
+        db.session.commit()
+        city1_id = city1.id
+
+        user_data = self.users[0]
+        user = User(
+            username=user_data["username"],
+            email=user_data["email"],
+            password=user_data["password"],
+            city_id=city1_id
+        )
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        # test adding species counts user in their city
+        Species.add_species(species_id, user_id)
+        self.assertEqual(CitySpeciesCount.get_count(city1_id, species_id), 1)
+
+        # test moving to another city moves user's count there
+        edit_profile(
+            user_id,
+            user_data["username"],
+            user_data["email"],
+            self.cities[1],
+            country.code
+        )
+        city2_id = User.query.get(user_id).city_id
+        self.assertNotEqual(city2_id, city1_id)
+        self.assertEqual(CitySpeciesCount.get_count(city1_id, species_id), 0)
+        self.assertEqual(CitySpeciesCount.get_count(city2_id, species_id), 1)
+
+        # test removing species stops counting user
+        Species.delete_species(species_id, user_id)
+        self.assertEqual(CitySpeciesCount.get_count(city2_id, species_id), 0)
+
+        # test deleting user stops counting user
+        Species.add_species(species_id, user_id)
+        self.assertEqual(CitySpeciesCount.get_count(city2_id, species_id), 1)
+        db.session.delete(User.query.get(user_id))
+        db.session.commit()
+        self.assertEqual(CitySpeciesCount.get_count(city2_id, species_id), 0)
+
     def test_make_notification(self):
         """
             Tests get correct notification
@@ -403,4 +560,48 @@ class HelpersTestCase(TestCase):
             username = self.users[i]["username"]
             email = self.users[i]["email"]
             self.assertNotIn(username, notification)
-            self.assertNotIn(email, notification)
\ No newline at end of file
+            self.assertNotIn(email, notification)
+
+    def test_queue_notifications(self) -> None:
+        """
+            Tests one notification is queued for each user in the city with the
+            species, listing every user but themself
+        """
+
+        species = Species(
+            name=self.species["name"],
+            threatened=self.species["threatened"]
+        )
+        db.session.add(species)
+        city = City(name=self.cities[0], country_id=self.countries[0].id)
+        db.session.add(city)
+        db.session.commit()
+        species_id = species.id
+        city_id = city.id
+
+        num_of_users = 3
+        for user_data in self.users[:num_of_users]:
+            user = User(
+                username=user_data["username"],
+                email=user_data["email"],
+                password=user_data["password"],
+                city_id=city_id
+            )
+            user.species.append(species)
+            db.session.add(user)
+        db.session.commit()
+
+        queue_notifications(species_id, city_id)
+
+        notifications = Notification.query.order_by(Notification.id).all()
+        self.assertEqual(len(notifications), num_of_users)
+        for i in range(num_of_users):
+            notification = notifications[i]
+            self.assertEqual(notification.recipient, self.users[i]["email"])
+            self.assertIn("Congratulations", notification.body)
+            for j in range(num_of_users):
+                email = self.users[j]["email"]
+                if i == j:
+                    self.assertNotIn(email, notification.body)
+                else:
+                    self.assertIn(email, notification.body)
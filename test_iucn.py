@@ -0,0 +1,195 @@
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from resilience import CircuitBreaker
+from cache import DiskCache
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+import os
+import sqlite3
+import tempfile
+import time
+import requests
+import iucn
+
+class IUCNTestCase(TestCase):
+    """
+        Tests for client used to call the Red List API
+    """
+
+    def test_get_session(self) -> None:
+        """
+            Tests the same pooled session is reused for every call
+        """
+
+        session = iucn.get_session()
+
+        self.assertIs(iucn.get_session(), session)
+        adapter = session.get_adapter(iucn.BASE_URL)
+        self.assertEqual(adapter.max_retries.total, iucn.MAX_RETRIES)
+
+    def test_get_retry_after(self) -> None:
+        """
+            Tests retries don't wait as long as the API's Retry-After asks
+        """
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                self.send_response(503)
+                self.send_header("Retry-After", "4")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args) -> None:
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base_url = f"http://127.0.0.1:{server.server_port}/"
+        with patch("iucn.BASE_URL", base_url), \
+            patch("iucn._session", None), \
+            patch("iucn.BACKOFF_FACTOR", 0.01), \
+            patch("iucn.breaker", CircuitBreaker(0.5, 4, 4, 60)), \
+            patch("iucn.RATE_LIMIT", 0), \
+            patch("iucn.CACHE_TTL", 0):
+            start_time = time.perf_counter()
+            with self.assertRaises(iucn.IUCNError):
+                iucn.get_countries()
+            self.assertLess(time.perf_counter() - start_time, 2)
+
+    def test_get(self) -> None:
+        """
+            Tests calls use timeouts and token, and errors become IUCNError
+        """
+
+        session = MagicMock()
+        session.get.return_value.json.return_value = { "result": [] }
+        with patch("iucn.get_session", return_value=session), \
+            patch("iucn.CACHE_TTL", 0):
+            data = iucn.get_species("canis lupus")
+
+            self.assertEqual(data, { "result": [] })
+            session.get.assert_called_once_with(
+                f"{iucn.BASE_URL}species/canis%20lupus",
+                params={ "token": iucn.TOKEN },
+                timeout=(iucn.CONNECT_TIMEOUT, iucn.READ_TIMEOUT)
+            )
+
+            # test that a failed call raises an IUCNError
+            session.get.side_effect = requests.ConnectionError()
+            with self.assertRaises(iucn.IUCNError):
+                iucn.get_countries()
+
+    def test_get_species_with_countries(self) -> None:
+        """
+            Tests gets both species data and its countries
+        """
+
+        species_data = { "name": "canis lupus", "result": [] }
+        countries_data = { "name": "canis lupus", "result": [] }
+        with patch("iucn.get_species", return_value=species_data), \
+            patch("iucn.get_species_countries", return_value=countries_data):
+            result = iucn.get_species_with_countries("canis lupus")
+
+        self.assertEqual(result, (species_data, countries_data))
+
+    def test_get_unavailable(self) -> None:
+        """
+            Tests calls fail fast once circuit breaker is open or rate limit is
+            reached, without calling the API
+        """
+
+        session = MagicMock()
+        breaker = CircuitBreaker(0.5, window=4, min_calls=2, reset_timeout=60)
+        with patch("iucn.get_session", return_value=session), \
+            patch("iucn.breaker", breaker), \
+            patch("iucn.CACHE_TTL", 0):
+            session.get.side_effect = requests.ConnectionError()
+            for i in range(2):
+                with self.assertRaises(iucn.IUCNError):
+                    iucn.get_countries()
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+            session.get.reset_mock()
+            with self.assertRaises(iucn.IUCNUnavailable):
+                iucn.get_countries()
+            session.get.assert_not_called()
+
+        session = MagicMock()
+        rate_limiter = MagicMock()
+        rate_limiter.acquire.return_value = False
+        breaker = CircuitBreaker(0.5, window=4, min_calls=2, reset_timeout=60)
+        with patch("iucn.get_session", return_value=session), \
+            patch("iucn.breaker", breaker), \
+            patch("iucn.rate_limiter", rate_limiter), \
+            patch("iucn.RATE_LIMIT", 1), \
+            patch("iucn.CACHE_TTL", 0):
+            with self.assertRaises(iucn.IUCNUnavailable):
+                iucn.get_countries()
+            session.get.assert_not_called()
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_get_rate_limiter_error(self) -> None:
+        """
+            Tests a broken rate limiter fails the call as unavailable, without
+            leaving a half open circuit breaker stuck on its trial call
+        """
+
+        session = MagicMock()
+        session.get.return_value.json.return_value = { "result": [] }
+        rate_limiter = MagicMock()
+        rate_limiter.acquire.side_effect = \
+            sqlite3.OperationalError("database is locked")
+        breaker = CircuitBreaker(0.5, window=4, min_calls=1, reset_timeout=0)
+        breaker.record(False)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with patch("iucn.get_session", return_value=session), \
+            patch("iucn.breaker", breaker), \
+            patch("iucn.rate_limiter", rate_limiter), \
+            patch("iucn.RATE_LIMIT", 1), \
+            patch("iucn.CACHE_TTL", 0):
+            with self.assertRaises(iucn.IUCNUnavailable):
+                iucn.get_countries()
+            session.get.assert_not_called()
+
+            # test trial call can still be made once limiter works again
+            rate_limiter.acquire.side_effect = None
+            rate_limiter.acquire.return_value = True
+            self.assertEqual(iucn.get_species("canis lupus"), { "result": [] })
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_get_cached(self) -> None:
+        """
+            Tests responses are cached, unless a fresh response is asked for
+        """
+
+        (fd, path) = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        session = MagicMock()
+        session.get.return_value.json.return_value = { "result": [] }
+        with patch("iucn.get_session", return_value=session), \
+            patch("iucn.response_cache", DiskCache(path, 60, 1024)):
+            self.assertEqual(iucn.get_species("canis lupus"), { "result": [] })
+            self.assertEqual(iucn.get_species("canis lupus"), { "result": [] })
+            self.assertEqual(session.get.call_count, 1)
+
+            iucn.get_species("canis lupus", fresh=True)
+            self.assertEqual(session.get.call_count, 2)
+
+            # other endpoints for the same name are cached separately
+            iucn.get_species_countries("canis lupus")
+            self.assertEqual(session.get.call_count, 3)
+
+            # test error responses aren't cached
+            session.get.return_value.json.return_value = { "message": "error" }
+            iucn.get_species("panthera leo")
+            iucn.get_species("panthera leo")
+            self.assertEqual(session.get.call_count, 5)
+
+            # test country list, which has its data in "results", is cached
+            session.get.return_value.json.return_value = { "results": [] }
+            self.assertEqual(iucn.get_countries(), { "results": [] })
+            self.assertEqual(iucn.get_countries(), { "results": [] })
+            self.assertEqual(session.get.call_count, 6)
@@ -0,0 +1,39 @@
+from unittest import TestCase
+from unittest.mock import patch
+import passwords
+
+class PasswordsTestCase(TestCase):
+    """
+        Tests for hashing and checking passwords
+    """
+
+    @patch("passwords.BCRYPT_ROUNDS", 4)
+    def test_hash_password(self) -> None:
+        """
+            Tests hashed password can be checked, in each hashing mode
+        """
+
+        for mode in ["inline", "process"]:
+            with patch("passwords.HASHING_MODE", mode):
+                hashed_password = passwords.hash_password("password")
+
+                self.assertNotEqual(hashed_password, "password")
+                self.assertTrue(
+                    passwords.check_password(hashed_password, "password")
+                )
+                self.assertFalse(
+                    passwords.check_password(hashed_password, "wrong")
+                )
+
+    def test_needs_rehash(self) -> None:
+        """
+            Tests only passwords hashed with a different number of rounds need
+            to be rehashed
+        """
+
+        hashed_password = passwords.hash_with_rounds("password", 4)
+
+        with patch("passwords.BCRYPT_ROUNDS", 4):
+            self.assertFalse(passwords.needs_rehash(hashed_password))
+        with patch("passwords.BCRYPT_ROUNDS", 5):
+            self.assertTrue(passwords.needs_rehash(hashed_password))
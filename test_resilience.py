@@ -0,0 +1,102 @@
+from unittest import TestCase
+from unittest.mock import patch
+from resilience import CircuitBreaker, TokenBucket
+import os
+import tempfile
+
+class TokenBucketTestCase(TestCase):
+    """
+        Tests for rate limiter shared by worker processes
+    """
+
+    def setUp(self) -> None:
+        """
+            Makes a file for the bucket
+        """
+
+        (fd, self.path) = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+
+    def tearDown(self) -> None:
+        """
+            Removes bucket's file
+        """
+
+        os.remove(self.path)
+
+    def test_take(self) -> None:
+        """
+            Tests bucket allows burst calls at once, then refills at rate
+        """
+
+        bucket = TokenBucket(self.path, "test", rate=2, burst=3)
+        with patch("resilience.time.time", return_value=1000):
+            for i in range(3):
+                self.assertEqual(bucket.take(), 0)
+            self.assertAlmostEqual(bucket.take(), 0.5)
+
+        # another process using the same file sees the same tokens
+        other_bucket = TokenBucket(self.path, "test", rate=2, burst=3)
+        with patch("resilience.time.time", return_value=1000.5):
+            self.assertEqual(other_bucket.take(), 0)
+            self.assertGreater(bucket.take(), 0)
+
+        # buckets with other names have their own tokens
+        with patch("resilience.time.time", return_value=1000.5):
+            self.assertEqual(TokenBucket(self.path, "other", 2, 3).take(), 0)
+
+    def test_acquire(self) -> None:
+        """
+            Tests acquire gives up if no token comes in time
+        """
+
+        bucket = TokenBucket(self.path, "test", rate=0.01, burst=1)
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0.1))
+
+class CircuitBreakerTestCase(TestCase):
+    """
+        Tests for CircuitBreaker
+    """
+
+    def test_circuit_breaker(self) -> None:
+        """
+            Tests breaker opens when too many calls fail, and closes again
+            once a trial call succeeds
+        """
+
+        breaker = CircuitBreaker(0.5, window=4, min_calls=4, reset_timeout=30)
+        with patch("resilience.time.monotonic", return_value=100):
+            for success in [True, False, True]:
+                self.assertTrue(breaker.allow())
+                breaker.record(success)
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+            breaker.record(False)
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+            self.assertFalse(breaker.allow())
+
+        # after reset_timeout, only one trial call is let through
+        with patch("resilience.time.monotonic", return_value=130):
+            self.assertTrue(breaker.allow())
+            self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+            self.assertFalse(breaker.allow())
+            breaker.record(False)
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        with patch("resilience.time.monotonic", return_value=160):
+            self.assertTrue(breaker.allow())
+            breaker.record(True)
+            self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+            self.assertTrue(breaker.allow())
+
+    def test_cancel(self) -> None:
+        """
+            Tests a trial call that wasn't made lets another one through
+        """
+
+        breaker = CircuitBreaker(0.5, window=2, min_calls=1, reset_timeout=0)
+        breaker.record(False)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.cancel()
+        self.assertTrue(breaker.allow())
@@ -1,7 +1,11 @@
 from unittest import TestCase
-from models import db, User, Species, City, Country, SpeciesError
+from models import db, User, Species, City, Country, SpeciesError, \
+    SpeciesUnavailable, MissingSpecies, IUCNResponse
 from app import app
 from sqlalchemy.exc import IntegrityError
+from unittest.mock import patch
+from datetime import datetime
+import iucn
 
 app.config["TESTING"] = True
 app.config["DEBUG_TB_HOST"] = ["dont-show-debug-toolbar"]
@@ -24,6 +28,7 @@ class SpeciesModelTestCase(TestCase):
         Species.query.delete()
         City.query.delete()
         Country.query.delete()
+        Country.invalidate_registry()
 
         self.test_species1 = {
             "name": "species1",
@@ -206,6 +211,12 @@ threatened={threatened}>'
         self.assertEqual(species.name, species_name)
 
         # test that I can't get a species that doesn't exist
+        with self.assertRaises(SpeciesError):
+            species = Species.get_species("bad species", country_success_id)
+        self.assertTrue(MissingSpecies.is_missing("bad species"))
+        self.assertFalse(MissingSpecies.is_missing(species_name))
+
+        # test that still can't get species the API didn't know
         with self.assertRaises(SpeciesError):
             species = Species.get_species("bad species", country_success_id)
 
@@ -213,6 +224,130 @@ threatened={threatened}>'
         with self.assertRaises(SpeciesError):
             species = Species.get_species(species_name, country_fail_id)
 
+    def test_save(self) -> None:
+        """
+            Tests saving a species that's already in db keeps the first one
+        """
+
+        Country.load_snapshot()
+        species_name = "loxodonta africana"
+        species_id = Species.save(species_name, "EN", ["ET", "KE", "ZZ"])
+        species = Species.query.get(species_id)
+        self.assertEqual(species.threatened, "EN")
+        self.assertEqual(
+            sorted(country.code for country in species.countries),
+            ["ET", "KE"]
+        )
+
+        # saving it again, like a worker that lost a race would, doesn't fail
+        self.assertEqual(Species.save(species_name, "VU", ["US"]), species_id)
+        self.assertEqual(Species.query.filter_by(name=species_name).count(), 1)
+        db.session.expire_all()
+        species = Species.query.get(species_id)
+        self.assertEqual(species.threatened, "EN")
+        self.assertEqual(len(species.countries), 2)
+
+    def test_refresh(self) -> None:
+        """
+            Tests stale species are still found, and refreshing them updates
+            their threatened level and countries
+        """
+
+        Country.load_snapshot()
+        species_name = "loxodonta africana"
+        species_id = Species.save(species_name, "VU", ["ET", "KE"])
+        species = Species.query.get(species_id)
+        self.assertFalse(species.is_stale())
+        self.assertEqual(Species.get_stale_names(10), [])
+
+        species.fetched_at = datetime(2000, 1, 1)
+        db.session.commit()
+        self.assertTrue(species.is_stale())
+        self.assertEqual(Species.get_stale_names(10), [species_name])
+
+        # stale species is given right away, with a refresh scheduled
+        with patch.object(Species, "schedule_refresh") as schedule_refresh:
+            self.assertEqual(Species.lookup(species_name).id, species_id)
+        schedule_refresh.assert_called_once_with()
+
+        data = { "name": species_name, "result": [{ "category": "EN" }] }
+        countries_data = {
+            "name": species_name,
+            "result": [{ "code": "KE" }, { "code": "TZ" }]
+        }
+        with patch(
+            "iucn.get_species_with_countries",
+            return_value=(data, countries_data)
+        ):
+            self.assertTrue(Species.refresh(species_name))
+
+        species = Species.query.get(species_id)
+        self.assertEqual(species.threatened, "EN")
+        self.assertEqual(
+            sorted(country.code for country in species.countries),
+            ["KE", "TZ"]
+        )
+        self.assertFalse(species.is_stale())
+
+        # old data is kept if API can't be reached
+        species.fetched_at = datetime(2000, 1, 1)
+        db.session.commit()
+        with patch(
+            "iucn.get_species_with_countries",
+            side_effect=iucn.IUCNError("Could not reach the Red List API")
+        ):
+            self.assertFalse(Species.refresh(species_name))
+        self.assertEqual(species.threatened, "EN")
+        self.assertTrue(species.is_stale())
+
+    def test_get_species_stale(self) -> None:
+        """
+            Tests species the API knew can still be found while it's down, even
+            if they aren't in db anymore
+        """
+
+        IUCNResponse.query.delete()
+        Country.load_snapshot()
+        country = Country.query.filter_by(code="KE").one()
+        species_name = "loxodonta africana"
+        data = { "name": species_name, "result": [{ "category": "EN" }] }
+        countries_data = { "name": species_name, "result": [{ "code": "KE" }] }
+        with patch(
+            "iucn.get_species_with_countries",
+            return_value=(data, countries_data)
+        ):
+            species = Species.get_species(species_name, country.id)
+        db.session.delete(species)
+        db.session.commit()
+
+        error = iucn.IUCNError("Could not reach the Red List API")
+        with patch("iucn.get_species_with_countries", side_effect=error):
+            species = Species.get_species(species_name, country.id)
+            self.assertEqual(species.name, species_name)
+            self.assertEqual(species.threatened, "EN")
+
+            # species API never gave us can't be found until API is back
+            with self.assertRaises(SpeciesUnavailable):
+                Species.get_species("canis lupus", country.id)
+
+    def test_get_species_api_error(self) -> None:
+        """
+            Tests an error body from the API isn't taken to mean the species
+            doesn't exist
+        """
+
+        Country.load_snapshot()
+        country = Country.query.filter_by(code="KE").one()
+        species_name = "diceros bicornis"
+        error_body = { "message": "Token not valid!" }
+        with patch(
+            "iucn.get_species_with_countries",
+            return_value=(error_body, error_body)
+        ):
+            with self.assertRaises(SpeciesError):
+                Species.get_species(species_name, country.id)
+        self.assertFalse(MissingSpecies.is_missing(species_name))
+
     def test_add_species(self) -> None:
         """
             Tests can add species to user only if not already on user's list
@@ -1,4 +1,5 @@
 from unittest import TestCase
+from unittest.mock import patch
 from models import db, User, Species, City, Country
 from app import app
 from sqlalchemy.exc import IntegrityError
@@ -24,6 +25,7 @@ class UserModelTestCase(TestCase):
         Species.query.delete()
         City.query.delete()
         Country.query.delete()
+        Country.invalidate_registry()
 
         # create city and country for user to live in
         country = Country(name="Country", code="CO")
@@ -257,4 +259,26 @@ password={password} city_id={city_id}>"
         self.assertIsNone(user)
 
         user = User.authenticate(username, "wrong")
-        self.assertIsNone(user)
\ No newline at end of file
+        self.assertIsNone(user)
+
+    def test_authenticate_rehash(self) -> None:
+        """
+            Tests password is rehashed on login when number of rounds changes
+        """
+
+        username = self.user1["username"]
+        email = self.user1["email"]
+        password = self.user1["password"]
+        with patch("passwords.BCRYPT_ROUNDS", 4):
+            user = User.signup(username, email, password, self.city.id)
+        old_hashed_password = user.password
+        self.assertTrue(old_hashed_password.startswith("$2b$04$"))
+
+        with patch("passwords.BCRYPT_ROUNDS", 5):
+            user = User.authenticate(username, password)
+
+        self.assertIsNotNone(user)
+        self.assertTrue(user.password.startswith("$2b$05$"))
+        # test new hash still works
+        with patch("passwords.BCRYPT_ROUNDS", 5):
+            self.assertIsNotNone(User.authenticate(username, password))
@@ -0,0 +1,169 @@
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from models import db, Notification
+from app import app
+from worker import deliver_notifications, send_messages, get_retry_delay, \
+    MAX_ATTEMPTS, MAX_RECONNECTS, RETRY_DELAY, MAX_RETRY_DELAY
+from datetime import datetime, timedelta
+import smtplib
+
+app.config["TESTING"] = True
+app.config["DEBUG_TB_HOST"] = ["dont-show-debug-toolbar"]
+app.config["SQLALCHEMY_DATABASE_URI"] = "postgresql:///threatened-species-test"
+
+db.create_all()
+
+class WorkerTestCase(TestCase):
+    """
+        Tests worker sends queued notifications
+    """
+
+    def setUp(self) -> None:
+        """
+            Sets up database for next tests
+        """
+
+        Notification.query.delete()
+        db.session.commit()
+
+        self.recipients = ["user1@gmail.com", "user2@gmail.com"]
+        notifications = [Notification(recipient=recipient, body="body") for \
+            recipient in self.recipients]
+        db.session.add_all(notifications)
+        db.session.commit()
+
+    def test_deliver_notifications(self) -> None:
+        """
+            Tests each queued notification is sent once
+        """
+
+        connection = MagicMock()
+        with patch("worker.mail.connect") as connect:
+            connect.return_value.__enter__.return_value = connection
+            send = connection.send
+            self.assertEqual(deliver_notifications(), len(self.recipients))
+            # test all notifications are sent over one connection
+            self.assertEqual(connect.call_count, 1)
+            self.assertEqual(send.call_count, len(self.recipients))
+            recipients = [call[0][0].recipients[0] for call in \
+                send.call_args_list]
+            self.assertEqual(recipients, self.recipients)
+
+            # test sent notifications aren't sent again
+            self.assertEqual(deliver_notifications(), 0)
+            self.assertEqual(send.call_count, len(self.recipients))
+
+        for notification in Notification.query.all():
+            self.assertIsNotNone(notification.sent_at)
+            self.assertEqual(notification.attempts, 1)
+
+    def test_deliver_notifications_fail(self) -> None:
+        """
+            Tests notifications that fail are tried again after a growing
+            delay, up to MAX_ATTEMPTS times
+        """
+
+        error = smtplib.SMTPServerDisconnected("disconnected")
+        with patch("worker.mail.connect", side_effect=error) as connect:
+            for i in range(MAX_ATTEMPTS):
+                self.assertEqual(deliver_notifications(), 0)
+                self.assertEqual(connect.call_count, i + 1)
+                # test failed notifications aren't tried again right away
+                self.assertEqual(deliver_notifications(), 0)
+                self.assertEqual(connect.call_count, i + 1)
+
+                now = datetime.utcnow()
+                for notification in Notification.query.all():
+                    delay = notification.next_attempt_at - now
+                    self.assertGreater(delay, get_retry_delay(i + 1) * 0.9)
+                    self.assertLessEqual(delay, get_retry_delay(i + 1))
+                    # make notification due now
+                    notification.next_attempt_at = now
+                db.session.commit()
+
+            # test notifications aren't tried after MAX_ATTEMPTS
+            self.assertEqual(deliver_notifications(), 0)
+            self.assertEqual(connect.call_count, MAX_ATTEMPTS)
+
+        for notification in Notification.query.all():
+            self.assertIsNone(notification.sent_at)
+            self.assertEqual(notification.attempts, MAX_ATTEMPTS)
+            self.assertEqual(notification.last_error, "disconnected")
+
+    def test_get_retry_delay(self) -> None:
+        """
+            Tests delay doubles after each attempt, up to MAX_RETRY_DELAY
+        """
+
+        self.assertEqual(get_retry_delay(1), timedelta(seconds=RETRY_DELAY))
+        self.assertEqual(get_retry_delay(2), get_retry_delay(1) * 2)
+        self.assertEqual(
+            get_retry_delay(100),
+            timedelta(seconds=MAX_RETRY_DELAY)
+        )
+
+    def test_send_messages(self) -> None:
+        """
+            Tests failure sending one message is reported without stopping the
+            others from being sent
+        """
+
+        messages = [MagicMock(), MagicMock(), MagicMock()]
+        connection = MagicMock()
+        connection.send.side_effect = \
+            [None, smtplib.SMTPRecipientsRefused({}), None]
+        with patch("worker.mail.connect") as connect:
+            connect.return_value.__enter__.return_value = connection
+            errors = send_messages(messages)
+
+        self.assertEqual(connection.send.call_count, len(messages))
+        self.assertIsNone(errors[0])
+        self.assertIsNotNone(errors[1])
+        self.assertIsNone(errors[2])
+
+    def test_send_messages_reconnect(self) -> None:
+        """
+            Tests messages are sent on a new connection if the server hangs up,
+            without sending the ones already sent again
+        """
+
+        messages = [MagicMock(), MagicMock(), MagicMock()]
+        connection = MagicMock()
+        connection.send.side_effect = \
+            [None, smtplib.SMTPServerDisconnected("disconnected"), None, None]
+        with patch("worker.mail.connect") as connect:
+            connect.return_value.__enter__.return_value = connection
+            errors = send_messages(messages)
+
+        self.assertEqual(connect.call_count, 2)
+        sent = [call[0][0] for call in connection.send.call_args_list]
+        self.assertEqual(sent, [messages[0], messages[1], messages[1], \
+            messages[2]])
+        self.assertEqual(errors, [None, None, None])
+
+        # test messages fail once server keeps hanging up
+        connection.send.side_effect = \
+            smtplib.SMTPServerDisconnected("disconnected")
+        with patch("worker.mail.connect") as connect:
+            connect.return_value.__enter__.return_value = connection
+            errors = send_messages(messages)
+
+        self.assertEqual(connect.call_count, MAX_RECONNECTS + 1)
+        self.assertEqual(errors, ["disconnected"] * len(messages))
+
+    def test_send_messages_close_fail(self) -> None:
+        """
+            Tests messages that were sent aren't failed when closing the
+            connection fails
+        """
+
+        messages = [MagicMock(), MagicMock()]
+        connection = MagicMock()
+        with patch("worker.mail.connect") as connect:
+            connect.return_value.__enter__.return_value = connection
+            connect.return_value.__exit__.side_effect = \
+                smtplib.SMTPServerDisconnected("disconnected")
+            errors = send_messages(messages)
+
+        self.assertEqual(connect.call_count, 1)
+        self.assertEqual(errors, [None, None])
@@ -0,0 +1,141 @@
+from flask_mail import Message
+from app import app, mail
+from models import db, Notification
+from datetime import datetime, timedelta
+from typing import List, Optional
+import metrics
+import smtplib
+import os
+import time
+
+# seconds to wait before checking for new notifications when there are none
+POLL_INTERVAL = float(os.environ.get("WORKER_POLL_INTERVAL", 5))
+BATCH_SIZE = int(os.environ.get("WORKER_BATCH_SIZE", 50))
+MAX_ATTEMPTS = int(os.environ.get("WORKER_MAX_ATTEMPTS", 5))
+# times to connect again in one batch when mail server hangs up part way
+MAX_RECONNECTS = int(os.environ.get("WORKER_MAX_RECONNECTS", 2))
+# seconds to wait before trying a failed notification again, doubling after
+# each attempt up to MAX_RETRY_DELAY, so an outage of the mail server doesn't
+# use up every attempt at once
+RETRY_DELAY = float(os.environ.get("WORKER_RETRY_DELAY", 60))
+MAX_RETRY_DELAY = float(os.environ.get("WORKER_MAX_RETRY_DELAY", 3600))
+# port worker serves its metrics on, since they're kept in this process and
+# not in the web workers' /metrics; 0 turns it off
+METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", 9102))
+# address it listens on; the port has no token check, so only this host can
+# reach it unless this is changed
+METRICS_ADDR = os.environ.get("WORKER_METRICS_ADDR", "127.0.0.1")
+
+def get_retry_delay(attempts: int) -> timedelta:
+    """
+        Gets time to wait before trying a notification again after it failed
+        attempts times
+        :type attempts: int
+        :rtype: timedelta
+    """
+
+    seconds = min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    return timedelta(seconds=seconds)
+
+def send_messages(messages: List[Message]) -> List[Optional[str]]:
+    """
+        Sends all messages over one connection to the mail server, connecting
+        again up to MAX_RECONNECTS times if the server hangs up. Returns error
+        for each message in the same order, or None if it was sent.
+        :type messages: list
+        :rtype: list
+    """
+
+    errors = [None] * len(messages)
+    # index of first message that hasn't been tried on a working connection
+    next_i = 0
+    reconnects = 0
+    while next_i < len(messages):
+        connected = False
+        try:
+            with mail.connect() as connection:
+                connected = True
+                for i in range(next_i, len(messages)):
+                    start_time = time.perf_counter()
+                    try:
+                        connection.send(messages[i])
+                    except smtplib.SMTPServerDisconnected:
+                        # message is tried again on the next connection
+                        metrics.observe_smtp_send(
+                            "error",
+                            time.perf_counter() - start_time
+                        )
+                        raise
+                    except (smtplib.SMTPException, OSError) as exc:
+                        errors[i] = str(exc)
+                    metrics.observe_smtp_send(
+                        "error" if errors[i] else "sent",
+                        time.perf_counter() - start_time
+                    )
+                    next_i = i + 1
+        except (smtplib.SMTPException, OSError) as exc:
+            # every message was tried, so error came from closing connection
+            if next_i == len(messages):
+                break
+            # if can't connect, none of the remaining messages can be sent
+            if not connected or reconnects == MAX_RECONNECTS:
+                for i in range(next_i, len(messages)):
+                    errors[i] = str(exc)
+                break
+            reconnects += 1
+    return errors
+
+def deliver_notifications(batch_size: int = BATCH_SIZE) -> int:
+    """
+        Sends up to batch_size notifications that haven't been sent yet and
+        are due, and returns how many were sent. Notifications that fail are
+        tried again after a delay that grows with each attempt, up to
+        MAX_ATTEMPTS times.
+        :type batch_size: int
+        :rtype: int
+    """
+
+    now = datetime.utcnow()
+    # skip notifications another worker is already sending
+    notifications = Notification.query.filter(
+        Notification.sent_at.is_(None),
+        Notification.attempts < MAX_ATTEMPTS,
+        Notification.next_attempt_at <= now
+    ).order_by(Notification.id).limit(batch_size).with_for_update(
+        skip_locked=True
+    ).all()
+    messages = [Message(
+        subject=notification.subject,
+        sender=app.config.get("MAIL_USERNAME"),
+        recipients=[notification.recipient],
+        body=notification.body
+    ) for notification in notifications]
+    errors = send_messages(messages)
+    now = datetime.utcnow()
+    for notification, error in zip(notifications, errors):
+        notification.attempts += 1
+        notification.last_error = error
+        if error:
+            notification.next_attempt_at = now + \
+                get_retry_delay(notification.attempts)
+        else:
+            notification.sent_at = now
+    db.session.commit()
+    return len([error for error in errors if not error])
+
+def run() -> None:
+    """
+        Keeps sending notifications as they're queued
+    """
+
+    if METRICS_PORT:
+        metrics.serve_metrics(METRICS_PORT, METRICS_ADDR)
+    with app.app_context():
+        while True:
+            # wait if nothing is due, or if nothing could be sent, which
+            # usually means mail server is down
+            if deliver_notifications() == 0:
+                time.sleep(POLL_INTERVAL)
+
+if __name__ == "__main__":
+    run()